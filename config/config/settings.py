@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "santa.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -85,14 +86,35 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# No persistent connections: under ASGI (config/Procfile) every request's
+# database work runs in a new thread, so a kept-alive connection would never be
+# reused and each request would leave one open until it aged out.
 DATABASES = {
     "default": dj_database_url.config(
         default="sqlite:///" + str(BASE_DIR / "db.sqlite3"),
-        conn_max_age=600
+        conn_max_age=0
     )
 }
 
 
+# Cache (solver results and event pages, see santa/solver_cache.py and
+# santa/page_cache.py). The default LocMemCache lives in one process and evicts
+# least-recently-used entries past MAX_ENTRIES; with several web workers set
+# CACHE_BACKEND (e.g. django.core.cache.backends.redis.RedisCache) and
+# CACHE_LOCATION so that they and the management commands share one cache.
+LOCMEM_CACHE = "django.core.cache.backends.locmem.LocMemCache"
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND") or LOCMEM_CACHE,
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+        "TIMEOUT": 60 * 60,
+    }
+}
+if CACHES["default"]["BACKEND"] == LOCMEM_CACHE:
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": 2000}
+PROCESS_LOCAL_CACHES = {LOCMEM_CACHE, "django.core.cache.backends.dummy.DummyCache"}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -149,9 +171,75 @@ EMAIL_HOST_PASSWORD = os.getenv("SENDGRID_API_KEY")
 
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL")
 
+# Match emails go through the outbox (santa/outbox.py, python manage.py send_outbox)
+SANTA_OUTBOX_BATCH_SIZE = 50
+SANTA_OUTBOX_MAX_ATTEMPTS = 5
+SANTA_OUTBOX_RETRY_SECONDS = 60  # doubled after every failed attempt
+# > 1: send_outbox sends each batch over this many SMTP connections at once (aiosmtplib)
+SANTA_SMTP_CONCURRENCY = int(os.getenv("SANTA_SMTP_CONCURRENCY", "1"))
+
 CSRF_TRUSTED_ORIGINS = [o.strip() for o in os.getenv(
     "CSRF_TRUSTED_ORIGINS",
     "http://127.0.0.1,http://localhost"
 ).split(",")]
 
-SITE_URL = os.getenv("SITE_URL", "http://127.0.0.1:8000")
\ No newline at end of file
+SITE_URL = os.getenv("SITE_URL", "http://127.0.0.1:8000")
+
+# Secret Santa limits
+SANTA_MAX_PARTICIPANTS = int(os.getenv("SANTA_MAX_PARTICIPANTS", "100"))
+
+# Roster upload (santa/importer.py): up to this many participants, saved in
+# INSERTs of SANTA_IMPORT_BATCH_SIZE rows
+SANTA_MAX_IMPORT_PARTICIPANTS = int(os.getenv("SANTA_MAX_IMPORT_PARTICIPANTS", "5000"))
+SANTA_IMPORT_BATCH_SIZE = 1000
+
+# "My events" shows this many events per page
+SANTA_EVENTS_PER_PAGE = 20
+
+# Event page lists at most this many matches; the export has them all, read
+# from the database SANTA_EXPORT_CHUNK_SIZE rows at a time
+SANTA_MATCHES_ON_PAGE = 200
+SANTA_EXPORT_CHUNK_SIZE = 2000
+
+# How long a solver verdict/solution stays cached (seconds)
+SANTA_SOLVER_CACHE_TIMEOUT = int(os.getenv("SANTA_SOLVER_CACHE_TIMEOUT", str(60 * 60)))
+
+# Every solve is reported as a logic.SolveStats to these functions (dotted
+# paths); the default logs solves slower than SANTA_SLOW_SOLVE_SECONDS
+SANTA_SOLVE_HOOKS = ["santa.logic.log_slow_solve"]
+SANTA_SLOW_SOLVE_SECONDS = float(os.getenv("SANTA_SLOW_SOLVE_SECONDS", "1.0"))
+
+# Rendered event page fragments (santa/page_cache.py), dropped whenever the
+# event changes. Off with a process-local cache: a change made by another worker
+# or a management command could not drop them. The timeout only bounds how long
+# unused ones stay around (seconds).
+SANTA_EVENT_PAGE_CACHE = CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_CACHES
+SANTA_EVENT_PAGE_CACHE_TIMEOUT = 10 * 60
+
+# A match generation still "running" after this many seconds is assumed to have
+# crashed and may be started again
+SANTA_GENERATION_TIMEOUT = 5 * 60
+
+# Unfinished create-event wizards older than this are deleted by purge_drafts
+SANTA_DRAFT_MAX_AGE_DAYS = 7
+
+# Events with history_mode on avoid pairings from the organizer's events this
+# many days before theirs (santa/history.py)
+SANTA_HISTORY_LOOKBACK_DAYS = 400
+
+# Per-view latency, query, solver and SMTP timings (santa/metrics.py): a
+# Server-Timing header on every response and Prometheus text at
+# /monitoring/metrics/ (staff, or "Authorization: Bearer <SANTA_METRICS_TOKEN>")
+SANTA_METRICS_ENABLED = os.getenv("SANTA_METRICS_ENABLED", "False") == "True"
+SANTA_METRICS_TOKEN = os.getenv("SANTA_METRICS_TOKEN", "")
+
+# The create form posts 2 fields per participant and the restrictions form up to
+# one checkbox per (giver, receiver) pair, so Django's default of 1000 is too low.
+DATA_UPLOAD_MAX_NUMBER_FIELDS = max(1000, SANTA_MAX_PARTICIPANTS * SANTA_MAX_PARTICIPANTS)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"santa": {"handlers": ["console"], "level": "INFO"}},
+}
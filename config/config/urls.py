@@ -28,9 +28,14 @@ urlpatterns = [
     path("", home, name="home"), #home as root
     path("logout/", logout_view, name="logout"),
     path("create/", create_event, name="create_event"),
+    path("create/import/", import_event_view, name="import_event"),
     path("events/", events, name="events"),
     path("events/<int:event_id>/", event_view, name="event_details"),
     path("restrictions/", restrictions_view, name="event_restrictions"),
+    path("restrictions/check/", restrictions_check_view, name="restrictions_check"),
     path("events/<int:event_id>/generate/", generate_matches_view, name="generate_matches"),
+    path("events/<int:event_id>/export/", export_matches_view, name="export_matches"),
+    path("monitoring/solver-cache/", solver_cache_stats_view, name="solver_cache_stats"),
+    path("monitoring/metrics/", metrics_view, name="metrics"),
 ]
 
@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import Event, Exclusion
+from .models import Event, Exclusion, OutboundEmail, PairingHistory
 
 admin.site.register(Event) #Event model so we can see it in /admin
 admin.site.register(Exclusion)
+admin.site.register(OutboundEmail) #queued match emails, to check on failed deliveries
+admin.site.register(PairingHistory) #past pairings, for events that avoid repeats
 
 # Register your models here.
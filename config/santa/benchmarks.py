@@ -0,0 +1,120 @@
+"""
+Benchmarks for the santa.logic solvers.
+
+Cases are generated constraint graphs (no database), solved straight through
+logic._solve_mode so the solver cache never short-circuits a run. Run them with
+`python manage.py bench_solvers`, which prints/writes JSON that can be diffed
+against the output of another commit (--compare).
+"""
+import random
+import time
+import tracemalloc
+from typing import Dict, Iterable, List, NamedTuple, Set
+
+from .logic import ConstraintGraph, SolveStats, SolverGaveUp, _solve_mode
+
+KINDS = ("random", "hall", "cycle", "soft")
+
+
+class Case(NamedTuple):
+    kind: str
+    n: int
+    density: float
+    seed: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}-n{self.n}-d{self.density:g}"
+
+
+def build_constraints(case: Case) -> Dict[int, Set[int]]:
+    """
+    random: every giver excludes density * (n - 1) random people
+    hall:   like random, plus a group of givers squeezed onto one receiver
+            fewer than the group size (infeasible, violates Hall's condition)
+    cycle:  like random, solved in single-circle mode
+    soft:   like hall, but every exclusion is a penalty of 1 (min-cost mode)
+    """
+    rng = random.Random(case.seed)
+    n = case.n
+    per_giver = int(case.density * (n - 1))
+    forbidden: Dict[int, Set[int]] = {}
+    for g in range(n):
+        if per_giver:
+            others = rng.sample(range(n), min(n, per_giver + 1))
+            forbidden[g] = {r for r in others if r != g}
+
+    if case.kind in ("hall", "soft"):
+        group = max(2, n // 10)
+        givers = rng.sample(range(n), group)
+        receivers = set(rng.sample(range(n), group - 1))
+        for g in givers:
+            forbidden[g] = set(range(n)) - receivers
+
+    return forbidden
+
+
+def make_cases(sizes: Iterable[int], densities: Iterable[float], kinds: Iterable[str] = KINDS, seed: int = 0) -> List[Case]:
+    return [Case(kind, n, density, seed) for kind in kinds for n in sizes for density in densities]
+
+
+def run_case(case: Case, repeat: int = 3) -> dict:
+    """Best-of-`repeat` wall time, plus peak memory and solver counters of one run."""
+    if case.kind == "soft":
+        graph = ConstraintGraph(case.n)
+        for g, excluded in build_constraints(case).items():
+            for r in excluded:
+                graph.penalize(g, r, 1)
+    else:
+        graph = ConstraintGraph(case.n, build_constraints(case))
+    single_cycle = case.kind == "cycle"
+
+    timings = []
+    feasible = None  # None: the cycle search gave up
+    for i in range(repeat):
+        rng = random.Random(case.seed + i)
+        started = time.perf_counter()
+        try:
+            feasible = _solve_mode(graph, single_cycle, rng) is not None
+        except SolverGaveUp:
+            feasible = None
+        timings.append(time.perf_counter() - started)
+
+    stats = SolveStats(case.n, "cycle" if single_cycle else "any", case.name)
+    tracemalloc.start()
+    try:
+        _solve_mode(graph, single_cycle, random.Random(case.seed), stats)
+    except SolverGaveUp:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "case": case.name,
+        "kind": case.kind,
+        "n": case.n,
+        "density": case.density,
+        "feasible": feasible,
+        "wall_ms": round(min(timings) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+        "attempts": stats.attempts,
+        "nodes": stats.nodes,
+        "backtracks": stats.backtracks,
+    }
+
+
+def compare(current: List[dict], baseline: List[dict]) -> List[dict]:
+    """Per-case wall time ratio current / baseline (> 1 means slower)."""
+    before = {row["case"]: row for row in baseline}
+    rows = []
+    for row in current:
+        old = before.get(row["case"])
+        if old is None or not old["wall_ms"]:
+            continue
+        rows.append({
+            "case": row["case"],
+            "baseline_ms": old["wall_ms"],
+            "current_ms": row["wall_ms"],
+            "ratio": round(row["wall_ms"] / old["wall_ms"], 2),
+        })
+    return rows
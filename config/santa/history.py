@@ -0,0 +1,83 @@
+"""
+Pairing history: who drew whom in an organizer's earlier events.
+
+PairingHistory is a copy of Match keyed by (organizer, giver email, event
+date), rewritten whenever an event's matches are saved. Generation reads the
+recent pairings of an event's givers from it with one indexed query instead of
+joining through every past Match and Participant row.
+"""
+import datetime
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Event, PairingHistory, Participant
+
+
+def history_rows(event: Event, matches: Dict[Participant, Participant]) -> List[PairingHistory]:
+    """Unsaved history rows for one event's matches (for record_pairings or a batch insert)."""
+    return [
+        PairingHistory(
+            organizer_id=event.organizer_id,
+            event=event,
+            event_date=event.event_date,
+            giver_email=giver.email.lower(),
+            receiver_email=receiver.email.lower(),
+        )
+        for giver, receiver in matches.items()
+    ]
+
+
+def record_pairings(event: Event, matches: Dict[Participant, Participant]) -> None:
+    """Replace the event's history with its new matches. Call where the matches are saved."""
+    PairingHistory.objects.filter(event=event).delete()
+    PairingHistory.objects.bulk_create(history_rows(event, matches))
+
+
+def previous_pairs(
+    events: Iterable[Tuple[Event, List[Participant]]],
+) -> Dict[int, List[Tuple[int, int]]]:
+    """
+    For each (event, participants in index order): the (giver_index,
+    receiver_index) pairs that already happened in the same organizer's events
+    dated up to SANTA_HISTORY_LOOKBACK_DAYS before it, matched by email.
+    One query for all the events.
+    """
+    lookback = datetime.timedelta(days=settings.SANTA_HISTORY_LOOKBACK_DAYS)
+    events = list(events)
+    result: Dict[int, List[Tuple[int, int]]] = {event.id: [] for event, _ in events}
+    if not events:
+        return result
+
+    window = Q()
+    for event, participants in events:
+        window |= Q(
+            organizer_id=event.organizer_id,
+            giver_email__in={p.email.lower() for p in participants},
+            event_date__gte=event.event_date - lookback,
+            event_date__lt=event.event_date,
+        )
+
+    seen: Dict[int, Dict[str, set]] = defaultdict(lambda: defaultdict(set))
+    for organizer_id, event_date, giver_email, receiver_email in PairingHistory.objects.filter(window).values_list(
+        "organizer_id", "event_date", "giver_email", "receiver_email"
+    ):
+        seen[organizer_id][giver_email].add((event_date, receiver_email))
+
+    for event, participants in events:
+        past = seen.get(event.organizer_id, {})
+        cutoff = event.event_date - lookback
+        index_of = defaultdict(list)
+        for i, p in enumerate(participants):
+            index_of[p.email.lower()].append(i)
+
+        pairs = set()
+        for g, giver in enumerate(participants):
+            for event_date, receiver_email in past.get(giver.email.lower(), ()):
+                if cutoff <= event_date < event.event_date:
+                    pairs.update((g, r) for r in index_of.get(receiver_email, ()))
+        result[event.id] = sorted(pairs)
+
+    return result
@@ -0,0 +1,134 @@
+"""
+Participant import for big events.
+
+A CSV or JSON Lines roster is read row by row straight from the upload (never
+loaded whole), validated in a single pass and turned into the same
+participants list + restrictions_map the create wizard produces, ready for
+create_event_with_participants.
+
+CSV: a header row with name, email and optionally excludes (names or emails
+of people this person must not draw, separated by ";").
+JSON Lines (.jsonl / .json): one {"name", "email", "excludes": [...]} object per line.
+"""
+import csv
+import io
+import json
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from .models import Participant
+
+# Stop collecting after this many problems, the organizer fixes the file and retries
+MAX_ERRORS = 20
+
+MAX_NAME_LENGTH = Participant._meta.get_field("name").max_length
+MAX_EMAIL_LENGTH = Participant._meta.get_field("email").max_length
+
+JSON_EXTENSIONS = (".jsonl", ".ndjson", ".json")
+
+
+class Roster(NamedTuple):
+    participants: List[dict]
+    restrictions_map: Dict[int, Set[int]]
+    errors: List[str]
+
+
+def _split(excludes) -> List[str]:
+    if excludes is None:
+        return []
+    if isinstance(excludes, str):
+        excludes = excludes.split(";")
+    return [str(ref).strip() for ref in excludes if str(ref).strip()]
+
+
+def _csv_rows(text: io.TextIOBase) -> Iterator[Tuple[int, Optional[dict]]]:
+    reader = csv.DictReader(text)
+    for row in reader:
+        yield reader.line_num, {key.strip().lower(): value for key, value in row.items() if key}
+
+
+def _jsonl_rows(text: io.TextIOBase) -> Iterator[Tuple[int, Optional[dict]]]:
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_no, row if isinstance(row, dict) else None
+
+
+def parse_roster(upload, max_participants: int) -> Roster:
+    """
+    upload: an UploadedFile (.csv or JSON Lines). Names and emails must be
+    unique (case-insensitive); excludes may point forwards in the file.
+    """
+    is_json = upload.name.lower().endswith(JSON_EXTENSIONS)
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline=None if is_json else "")
+    rows = _jsonl_rows(text) if is_json else _csv_rows(text)
+
+    participants: List[dict] = []
+    errors: List[str] = []
+    index_of: Dict[str, int] = {}                # lowercased name and email -> index
+    pending: List[Tuple[int, str, int]] = []     # (giver index, excludes reference, line)
+
+    try:
+        for line, row in rows:
+            if len(errors) >= MAX_ERRORS:
+                break
+            if row is None:
+                errors.append(f"Line {line}: not a JSON object.")
+                continue
+
+            name = str(row.get("name") or "").strip()
+            email = str(row.get("email") or "").strip()
+            if not name or not email:
+                errors.append(f"Line {line}: please give both a name and an email.")
+                continue
+            if len(name) > MAX_NAME_LENGTH:
+                errors.append(f"Line {line}: names can be at most {MAX_NAME_LENGTH} characters.")
+                continue
+            if len(email) > MAX_EMAIL_LENGTH:
+                errors.append(f"Line {line}: emails can be at most {MAX_EMAIL_LENGTH} characters.")
+                continue
+            try:
+                validate_email(email)
+            except ValidationError:
+                errors.append(f"Line {line}: {email} is not a valid email.")
+                continue
+            if name.lower() in index_of:
+                errors.append(f"Line {line}: the name {name} is used twice.")
+                continue
+            if email.lower() in index_of:
+                errors.append(f"Line {line}: the email {email} is used twice.")
+                continue
+            if len(participants) == max_participants:
+                errors.append(f"At most {max_participants} participants can be imported.")
+                break
+
+            giver = len(participants)
+            participants.append({"name": name, "email": email})
+            index_of[name.lower()] = giver
+            index_of[email.lower()] = giver
+            pending.extend((giver, ref, line) for ref in _split(row.get("excludes")))
+    except (UnicodeDecodeError, csv.Error) as exc:
+        errors.append(f"Could not read the file: {exc}")
+    finally:
+        text.detach()  # leave closing the upload to Django
+
+    restrictions_map: Dict[int, Set[int]] = {}
+    for giver, ref, line in pending:
+        if len(errors) >= MAX_ERRORS:
+            break
+        target = index_of.get(ref.lower())
+        if target is None:
+            errors.append(f"Line {line}: {ref} in excludes is not on the list.")
+        elif target != giver:
+            restrictions_map.setdefault(giver, set()).add(target)
+
+    if not errors and len(participants) < 4:
+        errors.append("Add at least 4 participants.")
+
+    return Roster(participants, restrictions_map, errors)
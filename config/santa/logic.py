@@ -1,133 +1,1277 @@
+import heapq
+import logging
 import random
-from typing import Dict, List, Optional, Set, Tuple
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import history, metrics, solver_cache
 from .models import Event, Participant, Exclusion
 
+# From this many participants on, the solvers switch to the large-event mode:
+# nobody builds n x n allowed lists, everything works off ConstraintGraph's
+# exclusions.
+LARGE_EVENT_THRESHOLD = 200
+
+# Large-event mode: random swaps tried per conflicting giver before falling
+# back to an augmenting-path search for it.
+REPAIR_TRIES = 20
+
+# Single-cycle mode: nodes the exhaustive search may expand before giving up.
+# Finding a Hamiltonian cycle is NP-hard, so this is what keeps it bounded.
+CYCLE_SEARCH_BUDGET = 50_000
+
+# Single-cycle mode: the search needs n x n allowed lists, so bigger events only
+# get the swap repair and the joining of a matching's cycles.
+CYCLE_SEARCH_LIMIT = 1000
+
+# After a perfect matching is found we walk it through random "swap two givers'
+# receivers" steps so the result isn't biased towards whatever Hopcroft-Karp
+# happened to find first. sweeps * n swap proposals per solve.
+MIXING_SWEEPS = 10
+
+# Soft constraints: events up to this size get the cheapest assignment
+# (min-cost matching, O(n^2) per giver the zero-cost start leaves unmatched);
+# bigger ones add the cheapest augmenting path for each of those givers.
+OPTIMIZE_LIMIT = 500
+
+# Penalty of repeating a pairing from an earlier event (history_mode "soft")
+HISTORY_PENALTY = 1
+
+UNMATCHED = -1
 
-def generate_secret_santa_matches(event: Event, *, max_attempts: int = 2000) -> Optional[Dict[Participant, Participant]]:
+# Seeds fit a signed 64-bit column (Event.match_seed)
+SEED_BITS = 63
+
+_NO_EXCLUSIONS: frozenset = frozenset()
+_NO_PENALTIES: Dict[int, int] = {}
+
+logger = logging.getLogger(__name__)
+
+
+class SolverGaveUp(Exception):
+    """
+    The single-cycle solver stopped without finding a circle and without
+    proving there is none (search budget or event size). Another seed may
+    find one, so this is not an "impossible" verdict.
     """
-    Returns a dict {giver_participant: receiver_participant} or None if impossible.
 
-    Uses backtracking with heuristics:
-    - assign givers with fewest options first
-    - try receivers in random order (so it can find a solution even if one path fails)
+
+class ConstraintGraph:
     """
-    participants: List[Participant] = list(event.participants.all())
-    n = len(participants)
-    if n < 4:
-        return None
+    Who may draw whom, shared by all the solvers.
+
+    Only exclusions are stored ({giver: {excluded}}), so memory grows with the
+    number of exclusions rather than n^2, and is_allowed() is a dict + set
+    lookup that allocates nothing. Nobody may draw themselves; that is implied
+    and never stored.
+
+    Soft constraints ({giver: {receiver: cost}}) are allowed pairs that cost a
+    penalty; the solvers then look for the cheapest assignment (_solve_weighted).
+    """
+
+    __slots__ = ("n", "_excluded", "_penalty")
+
+    def __init__(self, n: int, restrictions_map: Optional[Dict[int, Iterable[int]]] = None):
+        self.n = n
+        self._excluded: Dict[int, Set[int]] = {}
+        self._penalty: Dict[int, Dict[int, int]] = {}
+        for giver, excluded in (restrictions_map or {}).items():
+            for receiver in excluded:
+                self.exclude(giver, receiver)
+
+    def is_allowed(self, giver: int, receiver: int) -> bool:
+        return receiver != giver and receiver not in self._excluded.get(giver, _NO_EXCLUSIONS)
+
+    def excluded(self, giver: int) -> Set[int]:
+        """The giver's exclusions (without self). Do not modify."""
+        return self._excluded.get(giver, _NO_EXCLUSIONS)
+
+    def allowed(self, giver: int) -> List[int]:
+        """Receivers giver may draw. O(n), only the small-event solvers use it."""
+        excluded = self._excluded.get(giver, _NO_EXCLUSIONS)
+        return [r for r in range(self.n) if r != giver and r not in excluded]
+
+    def penalty(self, giver: int, receiver: int) -> int:
+        return self._penalty.get(giver, _NO_PENALTIES).get(receiver, 0)
+
+    def penalties(self, giver: int) -> Dict[int, int]:
+        """The giver's soft constraints {receiver: cost}. Do not modify."""
+        return self._penalty.get(giver, _NO_PENALTIES)
+
+    @property
+    def has_penalties(self) -> bool:
+        return bool(self._penalty)
+
+    def penalize(self, giver: int, receiver: int, cost: int) -> None:
+        """Make drawing receiver cost this much more (costs of several reasons add up)."""
+        if giver != receiver and cost > 0:
+            costs = self._penalty.setdefault(giver, {})
+            costs[receiver] = costs.get(receiver, 0) + cost
+
+    def strict(self) -> "ConstraintGraph":
+        """Copy where every penalized pair is excluded outright."""
+        graph = ConstraintGraph(self.n)
+        graph._excluded = {giver: set(excluded) for giver, excluded in self._excluded.items()}
+        for giver, costs in self._penalty.items():
+            graph._excluded.setdefault(giver, set()).update(costs)
+        return graph
+
+    def copy(self) -> "ConstraintGraph":
+        graph = ConstraintGraph(self.n)
+        graph._excluded = {giver: set(excluded) for giver, excluded in self._excluded.items()}
+        graph._penalty = {giver: dict(costs) for giver, costs in self._penalty.items()}
+        return graph
+
+    def exclude(self, giver: int, receiver: int) -> None:
+        if giver != receiver:
+            self._excluded.setdefault(giver, set()).add(receiver)
+
+    def allow(self, giver: int, receiver: int) -> None:
+        excluded = self._excluded.get(giver)
+        if excluded is not None:
+            excluded.discard(receiver)
+            if not excluded:
+                del self._excluded[giver]
+        costs = self._penalty.get(giver)
+        if costs is not None:
+            costs.pop(receiver, None)
+            if not costs:
+                del self._penalty[giver]
+
+    @property
+    def num_exclusions(self) -> int:
+        return sum(len(excluded) for excluded in self._excluded.values())
+
+    def pairs(self) -> Iterator[Tuple[int, int]]:
+        """(giver, excluded) pairs in a canonical order."""
+        for giver in sorted(self._excluded):
+            for receiver in sorted(self._excluded[giver]):
+                yield giver, receiver
+
+    def soft_pairs(self) -> Iterator[Tuple[int, int, int]]:
+        """(giver, receiver, cost) soft constraints in a canonical order."""
+        for giver in sorted(self._penalty):
+            for receiver, cost in sorted(self._penalty[giver].items()):
+                yield giver, receiver, cost
+
+
+class SolveStats:
+    """
+    What one solve did, handed to the SANTA_SOLVE_HOOKS.
+
+    attempts:   solver runs (cycle repairs, matching passes, min-cost runs)
+    nodes:      search nodes expanded (augmenting-path and cycle searches)
+    backtracks: dead ends the searches had to back out of
+    phases:     seconds per phase ("match", "mix", "repair", "patch", "search", "min_cost")
+    cached:     the assignment came from the solver cache, nothing was solved
+    """
+
+    __slots__ = ("label", "n", "mode", "attempts", "nodes", "backtracks", "phases", "seconds", "feasible", "cached")
+
+    def __init__(self, n: int = 0, mode: str = "any", label: str = ""):
+        self.label = label
+        self.n = n
+        self.mode = mode
+        self.attempts = 0
+        self.nodes = 0
+        self.backtracks = 0
+        self.phases: Dict[str, float] = {}
+        self.seconds = 0.0
+        self.feasible: Optional[bool] = None
+        self.cached = False
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def as_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __str__(self) -> str:
+        phases = " ".join(f"{name}={seconds:.3f}s" for name, seconds in sorted(self.phases.items()))
+        return (
+            f"{self.label or 'solve'}: n={self.n} mode={self.mode} feasible={self.feasible} "
+            f"{self.seconds:.3f}s attempts={self.attempts} nodes={self.nodes} "
+            f"backtracks={self.backtracks} {phases}"
+        ).rstrip()
+
+
+def _count(stats: Optional[SolveStats], key: str, amount: int = 1) -> None:
+    if stats is not None:
+        setattr(stats, key, getattr(stats, key) + amount)
+
+
+def _phase(stats: Optional[SolveStats], name: str):
+    return nullcontext() if stats is None else stats.phase(name)
+
+
+def _hopcroft_karp(allowed: List[List[int]], stats: Optional[SolveStats] = None) -> List[int]:
+    """
+    Maximum bipartite matching (givers on the left, receivers on the right).
+
+    allowed[g] = receivers giver g may draw. Returns match_of[g] = receiver or UNMATCHED.
+    Runs in O(E * sqrt(V)), no recursion (safe for big events).
+    """
+    n = len(allowed)
+    match_of = [UNMATCHED] * n       # giver -> receiver
+    owner_of = [UNMATCHED] * n       # receiver -> giver
+    dist = [0] * n
+    nodes = dead_ends = 0
+
+    while True:
+        # BFS: layer the free givers and find the shortest augmenting path length
+        queue = deque()
+        for g in range(n):
+            if match_of[g] == UNMATCHED:
+                dist[g] = 0
+                queue.append(g)
+            else:
+                dist[g] = -1
+
+        found = False
+        while queue:
+            g = queue.popleft()
+            for r in allowed[g]:
+                other = owner_of[r]
+                if other == UNMATCHED:
+                    found = True
+                elif dist[other] == -1:
+                    dist[other] = dist[g] + 1
+                    queue.append(other)
+
+        if not found:
+            _count(stats, "nodes", nodes)
+            _count(stats, "backtracks", dead_ends)
+            return match_of
+
+        # DFS along the layers, augmenting vertex-disjoint shortest paths
+        next_edge = [0] * n
+        for root in range(n):
+            if match_of[root] != UNMATCHED:
+                continue
+
+            stack = [root]
+            while stack:
+                g = stack[-1]
+                options = allowed[g]
+                advanced = False
+
+                while next_edge[g] < len(options):
+                    r = options[next_edge[g]]
+                    next_edge[g] += 1
+                    other = owner_of[r]
 
-    # Build forbidden set of (giver_id, receiver_id)
-    forbidden: Set[Tuple[int, int]] = set()
-    for ex in Exclusion.objects.filter(event=event).values_list("giver_id", "excluded_id"):
-        forbidden.add((ex[0], ex[1]))
+                    if other == UNMATCHED:
+                        # flip the whole path on the stack
+                        for giver in reversed(stack):
+                            previous = match_of[giver]
+                            match_of[giver] = r
+                            owner_of[r] = giver
+                            r = previous
+                        stack = []
+                        advanced = True
+                        break
 
-    # Nobody can draw themselves
-    for p in participants:
-        forbidden.add((p.id, p.id))
+                    if dist[other] == dist[g] + 1:
+                        stack.append(other)
+                        nodes += 1
+                        advanced = True
+                        break
 
-    # Precompute allowed receivers for each giver
-    allowed: Dict[int, List[int]] = {}
-    ids = [p.id for p in participants]
-    for giver_id in ids:
-        options = [rid for rid in ids if (giver_id, rid) not in forbidden]
-        allowed[giver_id] = options
+                if not advanced:
+                    dist[g] = -1  # dead end, don't visit again this phase
+                    stack.pop()
+                    dead_ends += 1
 
-    # Quick fail: if anyone has no options, impossible
-    if any(len(opts) == 0 for opts in allowed.values()):
+
+def _mix(assignment: List[int], graph: ConstraintGraph, rng: random.Random) -> None:
+    """
+    Random swap walk over valid assignments: pick two givers and trade receivers
+    when both of them are allowed to draw the other's receiver (and, with soft
+    constraints, the trade doesn't add penalty, so an optimum stays optimal).
+    """
+    n = len(assignment)
+    if n < 2:
+        return
+
+    is_allowed = graph.is_allowed
+    penalty = graph.penalty if graph.has_penalties else None
+    for _ in range(MIXING_SWEEPS * n):
+        a = rng.randrange(n)
+        b = rng.randrange(n)
+        if a == b:
+            continue
+        ra, rb = assignment[a], assignment[b]
+        if is_allowed(a, rb) and is_allowed(b, ra):
+            if penalty is not None and penalty(a, rb) + penalty(b, ra) > penalty(a, ra) + penalty(b, rb):
+                continue
+            assignment[a], assignment[b] = rb, ra
+
+
+def _random_perfect_matching(
+    graph: ConstraintGraph,
+    rng: random.Random,
+    stats: Optional[SolveStats] = None,
+) -> Optional[List[int]]:
+    """
+    Returns assignment[giver] = receiver covering everybody, or None if no
+    perfect matching exists (decided exactly, no restarts).
+    """
+    n = graph.n
+
+    # Relabel givers and shuffle their options so the search order is random
+    order = list(range(n))
+    rng.shuffle(order)
+    shuffled = []
+    for g in order:
+        options = graph.allowed(g)
+        # Quick fail: if anyone has no options, impossible
+        if not options:
+            return None
+        rng.shuffle(options)
+        shuffled.append(options)
+
+    with _phase(stats, "match"):
+        match_of = _hopcroft_karp(shuffled, stats)
+    if UNMATCHED in match_of:
         return None
 
-    id_to_participant = {p.id: p for p in participants}
+    assignment = [UNMATCHED] * n
+    for position, g in enumerate(order):
+        assignment[g] = match_of[position]
+
+    with _phase(stats, "mix"):
+        _mix(assignment, graph, rng)
+    return assignment
+
 
-    # Try multiple randomized attempts to avoid worst-case ordering issues
-    for _ in range(max_attempts):
-        # Givers sorted by fewest options first (MRV heuristic)
-        givers = sorted(ids, key=lambda gid: len(allowed[gid]))
+def _augment_sparse(
+    root: int,
+    graph: ConstraintGraph,
+    match_of: List[int],
+    owner_of: List[int],
+    reached: Optional[Set[int]] = None,
+    stats: Optional[SolveStats] = None,
+) -> bool:
+    """
+    One augmenting-path BFS from a free giver, on the complement of the
+    exclusion graph. Each receiver is taken out of `unseen` the first time it is
+    reached, so the search costs O(n + exclusions) instead of O(n^2).
+
+    On failure, `reached` (if given) receives every receiver the search got to:
+    exactly the receivers the root and the givers behind them can draw.
+    """
+    unseen = set(range(graph.n))
+    reached_from: Dict[int, int] = {}  # receiver -> giver that reached it
+    queue = deque([root])
 
-        used_receivers: Set[int] = set()
-        assignment: Dict[int, int] = {}
+    while queue:
+        g = queue.popleft()
+        _count(stats, "nodes")
+        blocked = graph.excluded(g)
+        hits = [r for r in unseen if r != g and r not in blocked]
+        for r in hits:
+            unseen.discard(r)
+            reached_from[r] = g
 
-        # Backtracking stack
-        def backtrack(idx: int) -> bool:
-            if idx == len(givers):
-                return True
+            if owner_of[r] == UNMATCHED:
+                # flip the path back to the root
+                while True:
+                    giver = reached_from[r]
+                    previous = match_of[giver]
+                    match_of[giver] = r
+                    owner_of[r] = giver
+                    if giver == root:
+                        return True
+                    r = previous
 
-            giver = givers[idx]
-            options = allowed[giver][:]
+            queue.append(owner_of[r])
 
-            # Prefer not-yet-used receivers, randomized for variety
-            options = [r for r in options if r not in used_receivers]
-            random.shuffle(options)
+    if reached is not None:
+        reached.update(reached_from)
+    _count(stats, "backtracks")
+    return False
 
-            for receiver in options:
-                assignment[giver] = receiver
-                used_receivers.add(receiver)
 
-                if backtrack(idx + 1):
+def _augment_cheapest(
+    root: int,
+    graph: ConstraintGraph,
+    match_of: List[int],
+    owner_of: List[int],
+    stats: Optional[SolveStats] = None,
+) -> bool:
+    """
+    _augment_sparse where drawing a penalized receiver costs its penalty: a
+    Dijkstra search, so the root joins through the path that adds the least
+    penalty. Receivers reached at no extra cost can't be reached cheaper and
+    leave `unseen` right away as in the BFS; only penalized ones wait.
+    """
+    unseen = set(range(graph.n))
+    reached_from: Dict[int, int] = {}  # receiver -> giver that reached it
+    heap: List[Tuple[int, int, int]] = []  # (penalty so far, receiver, giver)
+    g, paid = root, 0
+
+    while True:
+        _count(stats, "nodes")
+        blocked = graph.excluded(g)
+        costs = graph.penalties(g)
+        hits = [r for r in unseen if r != g and r not in blocked]
+        for r in hits:
+            cost = costs.get(r, 0)
+            if not cost:
+                unseen.discard(r)
+            heapq.heappush(heap, (paid + cost, r, g))
+
+        while heap:
+            paid, r, g = heapq.heappop(heap)
+            if r not in reached_from:
+                break
+        else:
+            _count(stats, "backtracks")
+            return False
+        reached_from[r] = g
+        unseen.discard(r)
+
+        if owner_of[r] == UNMATCHED:
+            while True:
+                giver = reached_from[r]
+                previous = match_of[giver]
+                match_of[giver] = r
+                owner_of[r] = giver
+                if giver == root:
                     return True
+                r = previous
+        g = owner_of[r]
+
 
-                # undo
-                used_receivers.remove(receiver)
-                del assignment[giver]
+def _sparse_start(graph: ConstraintGraph, rng: random.Random) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Random permutation with conflicting givers fixed by random swaps.
+    Returns (assignment, owner_of, free givers) where free givers are the ones
+    swaps couldn't fix; they are left UNMATCHED for _augment_sparse.
+    """
+    n = graph.n
+    is_allowed = graph.is_allowed
+    assignment = list(range(n))
+    rng.shuffle(assignment)
 
+    leftovers = []
+    for g in range(n):
+        if is_allowed(g, assignment[g]):
+            continue
+        for _ in range(REPAIR_TRIES):
+            h = rng.randrange(n)
+            if is_allowed(g, assignment[h]) and is_allowed(h, assignment[g]):
+                assignment[g], assignment[h] = assignment[h], assignment[g]
+                break
+        else:
+            leftovers.append(g)
+
+    owner_of = [UNMATCHED] * n
+    for g in range(n):
+        owner_of[assignment[g]] = g
+
+    free = []
+    for g in leftovers:
+        if not is_allowed(g, assignment[g]):
+            owner_of[assignment[g]] = UNMATCHED
+            assignment[g] = UNMATCHED
+            free.append(g)
+
+    return assignment, owner_of, free
+
+
+def _sparse_random_matching(
+    graph: ConstraintGraph,
+    rng: random.Random,
+    stats: Optional[SolveStats] = None,
+) -> Optional[List[int]]:
+    """
+    Large-event mode: never builds allowed lists. Starts from a random permutation, fixes conflicting givers with
+    random swaps, and finishes any leftovers with augmenting paths, which also
+    decides infeasibility exactly.
+    """
+    with _phase(stats, "match"):
+        assignment, owner_of, free = _sparse_start(graph, rng)
+        for g in free:
+            if not _augment_sparse(g, graph, assignment, owner_of, stats=stats):
+                return None
+
+    with _phase(stats, "mix"):
+        _mix(assignment, graph, rng)
+    return assignment
+
+
+def _cheap_matching(
+    graph: ConstraintGraph,
+    rng: random.Random,
+    stats: Optional[SolveStats] = None,
+) -> Optional[List[int]]:
+    """
+    Large events whose penalties can't all be avoided: a maximum matching on
+    graph.strict() costs nothing, then every giver it leaves out is added with
+    _augment_cheapest on the full graph. Not guaranteed optimal, but only the
+    givers that have to pay do.
+    """
+    _count(stats, "attempts")
+    strict = graph.strict()
+    with _phase(stats, "match"):
+        assignment, owner_of, free = _sparse_start(strict, rng)
+        free = [g for g in free if not _augment_sparse(g, strict, assignment, owner_of, stats=stats)]
+
+    with _phase(stats, "min_cost"):
+        for g in free:
+            if not _augment_cheapest(g, graph, assignment, owner_of, stats):
+                return None
+
+    with _phase(stats, "mix"):
+        _mix(assignment, graph, rng)
+    return assignment
+
+
+def _solve(
+    graph: ConstraintGraph,
+    rng: random.Random,
+    stats: Optional[SolveStats] = None,
+) -> Optional[List[int]]:
+    """
+    Picks the dense or the large-event solver depending on n.
+    stats (optional) collects counters and phase timings, see SolveStats.
+    """
+    _count(stats, "attempts")
+    if graph.n >= LARGE_EVENT_THRESHOLD:
+        return _sparse_random_matching(graph, rng, stats)
+    return _random_perfect_matching(graph, rng, stats)
+
+
+def _cycle_to_assignment(order: List[int]) -> List[int]:
+    """order[0] -> order[1] -> ... -> order[-1] -> order[0]"""
+    n = len(order)
+    assignment = [UNMATCHED] * n
+    for position, g in enumerate(order):
+        assignment[g] = order[(position + 1) % n]
+    return assignment
+
+
+def _repair_cycle(order: List[int], graph: ConstraintGraph, rng: random.Random) -> bool:
+    """
+    Fast path for single-cycle mode: walk the circle and, for every forbidden
+    hop, swap the receiver with a random node elsewhere in the circle as long
+    as all four hops touched by the swap are allowed. O(n) when exclusions are
+    light. Returns True if `order` ended up a valid circle.
+    """
+    n = len(order)
+    is_allowed = graph.is_allowed
+
+    def hops_ok(*positions: int) -> bool:
+        for p in positions:
+            if not is_allowed(order[(p - 1) % n], order[p]) or not is_allowed(order[p], order[(p + 1) % n]):
+                return False
+        return True
+
+    for position in range(n):
+        nxt = (position + 1) % n
+        if is_allowed(order[position], order[nxt]):
+            continue
+        for _ in range(REPAIR_TRIES):
+            j = rng.randrange(n)
+            if j == nxt:
+                continue
+            order[nxt], order[j] = order[j], order[nxt]
+            if hops_ok(nxt, j):
+                break
+            order[nxt], order[j] = order[j], order[nxt]
+        else:
             return False
 
-        if backtrack(0):
-            # Convert id mapping -> object mapping
-            result = {id_to_participant[g]: id_to_participant[r] for g, r in assignment.items()}
-            # sanity: must be perfect matching
-            if len(result) == n and len({v.id for v in result.values()}) == n:
-                return result
+    return all(is_allowed(order[p], order[(p + 1) % n]) for p in range(n))
+
+
+def _patch_cycles(assignment: List[int], graph: ConstraintGraph, rng: random.Random) -> bool:
+    """
+    Turns a valid assignment (a set of cycles) into one circle: giver a in the
+    smallest cycle and giver b in another trade receivers when each may draw
+    the other's, which joins the two cycles. Works off the exclusions like the
+    large-event solvers, O(size of the cycle x n) per join. Returns False when
+    the smallest cycle can't be joined to any other this way.
+    """
+    n = len(assignment)
+    is_allowed = graph.is_allowed
+    giver_of = [UNMATCHED] * n
+    for g, r in enumerate(assignment):
+        giver_of[r] = g
+
+    cycle_of = [UNMATCHED] * n
+    members: Dict[int, List[int]] = {}
+    for g in range(n):
+        if cycle_of[g] == UNMATCHED:
+            members[g] = []
+            v = g
+            while cycle_of[v] == UNMATCHED:
+                cycle_of[v] = g
+                members[g].append(v)
+                v = assignment[v]
+
+    while len(members) > 1:
+        smallest = min(members, key=lambda c: len(members[c]))
+        givers = list(members[smallest])
+        rng.shuffle(givers)
+        joined = False
+        for a in givers:
+            blocked = graph.excluded(a)
+            receivers = [r for r in range(n) if cycle_of[r] != smallest and r != a and r not in blocked]
+            rng.shuffle(receivers)
+            for r in receivers:
+                b = giver_of[r]
+                if not is_allowed(b, assignment[a]):
+                    continue
+                ra = assignment[a]
+                assignment[a], assignment[b] = r, ra
+                giver_of[r], giver_of[ra] = a, b
+                other = cycle_of[b]
+                for v in members[smallest]:
+                    cycle_of[v] = other
+                members[other].extend(members.pop(smallest))
+                joined = True
+                break
+            if joined:
+                break
+        if not joined:
+            return False
+    return True
+
+
+def _search_cycle(
+    graph: ConstraintGraph,
+    rng: random.Random,
+    stats: Optional[SolveStats] = None,
+) -> Optional[List[int]]:
+    """
+    Depth-first search for a single circle through everybody, visiting at most
+    CYCLE_SEARCH_BUDGET nodes. Returns None only when the whole search space
+    was covered (there is no circle) and raises SolverGaveUp when the budget
+    ran out first.
+
+    Pruning: every person not yet on the path must still have someone left who
+    can give to them and someone left they can give to, otherwise the branch
+    is dropped right away. Next hops are tried fewest-onward-options first.
+    Iterative (a stack of frames, one per path position), so the path may be
+    longer than the recursion limit.
+    """
+    n = graph.n
+    allowed = [graph.allowed(g) for g in range(n)]
+    givers_of: List[List[int]] = [[] for _ in range(n)]
+    for g in range(n):
+        for r in allowed[g]:
+            givers_of[r].append(g)
+
+    start = rng.randrange(n)
+    # in_left[v]: possible givers for v among the path's tail + unvisited
+    # out_left[v]: possible receivers for v among unvisited + start
+    in_left = [len(givers_of[v]) for v in range(n)]
+    out_left = [len(allowed[v]) for v in range(n)]
+    visited = [False] * n
+    visited[start] = True
+    path = [start]
+    budget = CYCLE_SEARCH_BUDGET
+    backtracks = 0
+
+    def close_tail(tail: int) -> List[int]:
+        # tail gives its gift now, so it stops being a possible giver for others
+        emptied = []
+        for r in allowed[tail]:
+            in_left[r] -= 1
+            if in_left[r] == 0 and (not visited[r] or r == start):
+                emptied.append(r)
+        return emptied
+
+    def reopen_tail(tail: int) -> None:
+        for r in allowed[tail]:
+            in_left[r] += 1
+
+    def take(v: int) -> List[int]:
+        # v has a giver now, so it stops being a possible receiver for others
+        visited[v] = True
+        emptied = []
+        for g in givers_of[v]:
+            out_left[g] -= 1
+            if out_left[g] == 0 and (not visited[g] or g == v):
+                emptied.append(g)
+        return emptied
+
+    def release(v: int) -> None:
+        visited[v] = False
+        for g in givers_of[v]:
+            out_left[g] += 1
+
+    def next_hops(tail: int) -> List[int]:
+        options = [r for r in allowed[tail] if not visited[r]]
+        rng.shuffle(options)
+        options.sort(key=lambda r: out_left[r])
+        # Whoever only had `tail` left as a giver must be the next hop
+        dead = set(close_tail(tail))
+        if len(dead) > 1:
+            return []
+        if dead:
+            return [r for r in options if r in dead]
+        return options
+
+    def report() -> None:
+        _count(stats, "nodes", CYCLE_SEARCH_BUDGET - max(budget, 0))
+        _count(stats, "backtracks", backtracks)
 
+    frames = [[next_hops(start), 0]]  # [options, next one to try] per path position
+    while frames:
+        frame = frames[-1]
+        options, i = frame
+        if i == len(options):
+            frames.pop()
+            reopen_tail(path[-1])
+            if len(path) > 1:
+                release(path.pop())
+                backtracks += 1
+            continue
+        frame[1] = i + 1
+
+        r = options[i]
+        stuck = take(r)
+        path.append(r)
+        if not stuck:
+            budget -= 1
+            if budget < 0:
+                report()
+                raise SolverGaveUp(f"no circle found within {CYCLE_SEARCH_BUDGET} search nodes")
+            if len(path) < n:
+                frames.append([next_hops(r), 0])
+                continue
+            if start in allowed[r]:
+                report()
+                return path
+        path.pop()
+        release(r)
+        backtracks += 1
+
+    report()
     return None
 
-def dry_run_matches_from_restrictions(
-    num_participants: int,
-    restrictions_map: Dict[int, Set[int]],
-    *,
-    max_attempts: int = 2000
-) -> Optional[Dict[int, int]]:
+
+def _single_cycle(
+    graph: ConstraintGraph,
+    rng: random.Random,
+    stats: Optional[SolveStats] = None,
+) -> Optional[List[int]]:
     """
-    restrictions_map: giver_index -> set of forbidden receiver_indexes (should include self)
-    returns mapping giver_index -> receiver_index, or None if impossible
+    Single-cycle mode. No exclusions: shuffle + rotate, O(n). Light exclusions:
+    shuffle and repair with swaps. When that fails: a plain matching (None
+    if there is none, which proves there is no circle either), whose cycles
+    are then joined into one. Only if they can't be does the bounded search
+    run, for events up to CYCLE_SEARCH_LIMIT.
+
+    Returns None only when no circle exists; raises SolverGaveUp when the
+    search budget ran out, or the event is too big to search, without finding one.
     """
-    n = num_participants
-    ids = list(range(n))
+    n = graph.n
+    order = list(range(n))
+    rng.shuffle(order)
+    if not graph.num_exclusions:
+        _count(stats, "attempts")
+        return _cycle_to_assignment(order)
 
-    # allowed receivers per giver (index-based)
-    allowed: Dict[int, List[int]] = {}
-    for gi in ids:
-        forbidden = restrictions_map.get(gi, set())
-        allowed[gi] = [r for r in ids if r not in forbidden]
+    with _phase(stats, "repair"):
+        for _ in range(REPAIR_TRIES):
+            _count(stats, "attempts")
+            if _repair_cycle(order, graph, rng):
+                return _cycle_to_assignment(order)
+            rng.shuffle(order)
 
-    # quick fail
-    if any(len(opts) == 0 for opts in allowed.values()):
+    assignment = _solve(graph, rng, stats)
+    if assignment is None:
         return None
+    with _phase(stats, "patch"):
+        if _patch_cycles(assignment, graph, rng):
+            return assignment
 
-    for _ in range(max_attempts):
-        givers = sorted(ids, key=lambda gi: len(allowed[gi]))  # most constrained first
-        used = set()
-        assignment: Dict[int, int] = {}
+    if n > CYCLE_SEARCH_LIMIT:
+        raise SolverGaveUp(f"no circle found, {n} people is too many to search")
+    with _phase(stats, "search"):
+        order = _search_cycle(graph, rng, stats)
+    if order is None:
+        return None
+    return _cycle_to_assignment(order)
 
-        def backtrack(k: int) -> bool:
-            if k == n:
-                return True
 
-            giver = givers[k]
-            options = [r for r in allowed[giver] if r not in used]
-            random.shuffle(options)
+def _min_cost_matching(
+    graph: ConstraintGraph,
+    rng: random.Random,
+    stats: Optional[SolveStats] = None,
+) -> Optional[List[int]]:
+    """
+    Cheapest perfect matching under the graph's penalties (Hungarian method,
+    shortest augmenting paths with potentials), or None if there is none.
 
-            for r in options:
-                assignment[giver] = r
-                used.add(r)
-                if backtrack(k + 1):
-                    return True
-                used.remove(r)
-                del assignment[giver]
-            return False
+    A maximum matching that avoids every penalized pair already costs 0, which
+    is optimal for its size, so it is the starting point and only the givers it
+    leaves out need an O(n^2) augmentation each. Rows are shuffled so equally
+    cheap answers are picked at random.
+    """
+    n = graph.n
+    order = list(range(n))
+    rng.shuffle(order)
 
-        if backtrack(0):
-            return assignment
+    strict = graph.strict()
+    options = []
+    for g in order:
+        opts = strict.allowed(g)
+        rng.shuffle(opts)
+        options.append(opts)
+    with _phase(stats, "match"):
+        start = _hopcroft_karp(options, stats)
+
+    # 1-based as in the textbook version: row i is giver order[i - 1],
+    # column j is receiver j - 1, p[j] = row holding column j (0 = free)
+    inf = float("inf")
+    u = [0] * (n + 1)
+    v = [0] * (n + 1)
+    p = [0] * (n + 1)
+    way = [0] * (n + 1)
+    for position, r in enumerate(start):
+        if r != UNMATCHED:
+            p[r + 1] = position + 1
+
+    rows = 0
+    with _phase(stats, "min_cost"):
+        for position, r in enumerate(start):
+            if r != UNMATCHED:
+                continue
+            p[0] = position + 1
+            j0 = 0
+            minv = [inf] * (n + 1)
+            used = [False] * (n + 1)
+            while True:
+                rows += 1
+                used[j0] = True
+                i0 = p[j0]
+                g = order[i0 - 1]
+                blocked = graph.excluded(g)
+                costs = graph.penalties(g)
+                ui0 = u[i0]
+                delta = inf
+                j1 = 0
+                for j in range(1, n + 1):
+                    if used[j]:
+                        continue
+                    receiver = j - 1
+                    if receiver != g and receiver not in blocked:
+                        cur = costs.get(receiver, 0) - ui0 - v[j]
+                        if cur < minv[j]:
+                            minv[j] = cur
+                            way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+                if delta == inf:
+                    _count(stats, "nodes", rows)
+                    return None  # this giver can't be fitted in at any price
+
+                for j in range(n + 1):
+                    if used[j]:
+                        u[p[j]] += delta
+                        v[j] -= delta
+                    else:
+                        minv[j] -= delta
+                j0 = j1
+                if p[j0] == 0:
+                    break
+
+            while j0:
+                j1 = way[j0]
+                p[j0] = p[j1]
+                j0 = j1
+
+    _count(stats, "nodes", rows)
 
+    assignment = [UNMATCHED] * n
+    for j in range(1, n + 1):
+        assignment[order[p[j] - 1]] = j - 1
+
+    with _phase(stats, "mix"):
+        _mix(assignment, graph, rng)
+    return assignment
+
+
+def _solve_weighted(
+    graph: ConstraintGraph,
+    single_cycle: bool,
+    rng: random.Random,
+    stats: Optional[SolveStats] = None,
+) -> Optional[List[int]]:
+    """
+    Graphs with soft constraints. If every penalized pair can be avoided the
+    usual solvers do it on graph.strict() (zero penalty, same randomness);
+    otherwise any-pairing events up to OPTIMIZE_LIMIT get the min-cost
+    matching and bigger ones _cheap_matching. Single circles get a valid
+    answer that is not guaranteed to be the cheapest.
+    """
+    try:
+        assignment = _solve_mode(graph.strict(), single_cycle, rng, stats)
+    except SolverGaveUp:
+        assignment = None  # the full graph has more room
+    if assignment is not None:
+        return assignment
+
+    if single_cycle:
+        return _single_cycle(graph, rng, stats)
+    if graph.n > OPTIMIZE_LIMIT:
+        return _cheap_matching(graph, rng, stats)
+    _count(stats, "attempts")
+    return _min_cost_matching(graph, rng, stats)
+
+
+def _solve_mode(
+    graph: ConstraintGraph,
+    single_cycle: bool,
+    rng: random.Random,
+    stats: Optional[SolveStats] = None,
+) -> Optional[List[int]]:
+    if graph.has_penalties:
+        return _solve_weighted(graph, single_cycle, rng, stats)
+    if single_cycle:
+        return _single_cycle(graph, rng, stats)
+    return _solve(graph, rng, stats)
+
+
+class HallViolation(NamedTuple):
+    """
+    A group of givers who, between them, may only draw fewer people than
+    there are givers in the group (so no valid assignment exists).
+    """
+    givers: List[int]
+    receivers: List[int]
+
+
+# Shrinking the violating group is O(group^3); bigger groups are reported as found
+MINIMIZE_GROUP_LIMIT = 150
+
+
+def _minimize_violation(givers: Set[int], receivers: Set[int], graph: ConstraintGraph) -> HallViolation:
+    """
+    Drops givers one at a time as long as the rest still can't be covered, so
+    the organizer only sees the exclusions that actually matter.
+    """
+    is_allowed = graph.is_allowed
+    group = set(givers)
+    if len(group) <= MINIMIZE_GROUP_LIMIT:
+        for g in sorted(givers):
+            rest = group - {g}
+            covered = {r for r in receivers if any(is_allowed(x, r) for x in rest)}
+            if len(covered) < len(rest):
+                group = rest
+
+    covered = {r for r in receivers if any(is_allowed(x, r) for x in group)}
+    return HallViolation(sorted(group), sorted(covered))
+
+
+def find_hall_violation(num_participants: int, restrictions_map: Dict[int, Set[int]]) -> Optional[HallViolation]:
+    """
+    restrictions_map: giver_index -> set of forbidden receiver_indexes (as for the dry run)
+    returns None if a valid assignment exists, otherwise the (small) group of
+    givers that can't all be served by the receivers left to them.
+
+    Grows a maximum matching; the first giver that can't be matched gives the
+    group via Hall's theorem: it plus everyone its failed augmenting search
+    reached can only draw the receivers that search reached, one too few.
+    """
+    return _hall_violation(ConstraintGraph(num_participants, restrictions_map))
+
+
+def _hall_violation(graph: ConstraintGraph) -> Optional[HallViolation]:
+    assignment, owner_of, free = _sparse_start(graph, random.Random(0))
+    for g in free:
+        reached: Set[int] = set()
+        if not _augment_sparse(g, graph, assignment, owner_of, reached):
+            givers = {g} | {owner_of[r] for r in reached}
+            return _minimize_violation(givers, reached, graph)
     return None
 
+
+class IncrementalMatcher:
+    """
+    Keeps a maximum matching for the restrictions form while the organizer
+    ticks boxes, so each change costs at most a few augmenting-path searches
+    instead of a full solve.
+
+    Removing a used pair frees one giver and one augmenting search from it
+    repairs the matching; adding an allowed pair to a perfect matching costs
+    nothing. Only an already infeasible state retries its (few) free givers.
+    """
+
+    def __init__(self, num_participants: int, restrictions_map: Optional[Dict[int, Set[int]]] = None):
+        self.graph = ConstraintGraph(num_participants, restrictions_map)
+        self.match_of, self.owner_of, _ = _sparse_start(self.graph, random.Random())
+        self._repair()
+
+    @property
+    def n(self) -> int:
+        return self.graph.n
+
+    def _repair(self) -> None:
+        # one pass suffices: a giver with no augmenting path keeps having none
+        for g in range(self.n):
+            if self.match_of[g] == UNMATCHED:
+                _augment_sparse(g, self.graph, self.match_of, self.owner_of)
+
+    @property
+    def feasible(self) -> bool:
+        return UNMATCHED not in self.match_of
+
+    def exclude(self, giver: int, receiver: int) -> bool:
+        """giver may no longer draw receiver. Returns feasibility."""
+        if giver == receiver:
+            return self.feasible
+        self.graph.exclude(giver, receiver)
+        if self.match_of[giver] == receiver:
+            self.match_of[giver] = UNMATCHED
+            self.owner_of[receiver] = UNMATCHED
+            self._repair()
+        return self.feasible
+
+    def allow(self, giver: int, receiver: int) -> bool:
+        """Undo an exclusion. Returns feasibility."""
+        self.graph.allow(giver, receiver)
+        if not self.feasible:
+            self._repair()
+        return self.feasible
+
+    def violation(self) -> Optional[HallViolation]:
+        return _hall_violation(self.graph)
+
+    def to_state(self) -> dict:
+        """JSON-friendly snapshot (for the session)."""
+        forbidden: Dict[str, List[int]] = {}
+        for g, r in self.graph.pairs():
+            forbidden.setdefault(str(g), []).append(r)
+        return {"n": self.n, "forbidden": forbidden, "match_of": self.match_of}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "IncrementalMatcher":
+        matcher = cls.__new__(cls)
+        matcher.graph = ConstraintGraph(state["n"], {int(g): excluded for g, excluded in state["forbidden"].items()})
+        matcher.match_of = list(state["match_of"])
+        matcher.owner_of = [UNMATCHED] * matcher.n
+        for g, r in enumerate(matcher.match_of):
+            if r != UNMATCHED:
+                matcher.owner_of[r] = g
+        return matcher
+
+
+def new_seed() -> int:
+    """Fresh seed for a solve, from the OS so concurrent requests never share one."""
+    return random.SystemRandom().getrandbits(SEED_BITS)
+
+
+def event_graph(
+    participants: List[Participant],
+    exclusions: Iterable[Tuple[int, int, Optional[int]]],
+) -> ConstraintGraph:
+    """
+    Constraint graph of one event. participants fixes the index order (by id),
+    exclusions are (giver_id, excluded_id, penalty) rows: no penalty is a hard
+    exclusion, a penalty a soft one. Rows naming someone outside participants
+    are ignored.
+    """
+    index_of = {p.id: i for i, p in enumerate(participants)}
+    graph = ConstraintGraph(len(participants))
+    for giver_id, excluded_id, penalty in exclusions:
+        if giver_id in index_of and excluded_id in index_of:
+            if penalty is None:
+                graph.exclude(index_of[giver_id], index_of[excluded_id])
+            else:
+                graph.penalize(index_of[giver_id], index_of[excluded_id], penalty)
+    return graph
+
+
+def with_history(graph: ConstraintGraph, history_mode: str, repeats: List[Tuple[int, int]]) -> ConstraintGraph:
+    """
+    The graph for an event with this history_mode, given the (giver, receiver)
+    pairs it had before (history.previous_pairs): "hard" forbids the repeats,
+    "soft" makes each cost HISTORY_PENALTY so as few as possible happen.
+    """
+    if history_mode == Event.HISTORY_OFF or not repeats:
+        return graph
+
+    graph = graph.copy()
+    for giver, receiver in repeats:
+        if history_mode == Event.HISTORY_HARD:
+            graph.exclude(giver, receiver)
+        else:
+            graph.penalize(giver, receiver, HISTORY_PENALTY)
+    return graph
+
+
+def log_slow_solve(stats: SolveStats) -> None:
+    """Default SANTA_SOLVE_HOOKS entry: warn about solves over SANTA_SLOW_SOLVE_SECONDS."""
+    if stats.seconds >= settings.SANTA_SLOW_SOLVE_SECONDS:
+        logger.warning("slow solve %s", stats, extra={"solve_stats": stats.as_dict()})
+
+
+def _report(stats: SolveStats) -> None:
+    for path in settings.SANTA_SOLVE_HOOKS:
+        import_string(path)(stats)
+
+
+def _report_cached(graph: ConstraintGraph, single_cycle: bool, feasible: bool, label: str) -> None:
+    stats = SolveStats(graph.n, "cycle" if single_cycle else "any", label)
+    stats.feasible = feasible
+    stats.cached = True
+    _report(stats)
+
+
+def _solve_seeded(
+    graph: ConstraintGraph,
+    single_cycle: bool,
+    seed: int,
+    label: str = "",
+) -> Optional[List[int]]:
+    """_solve_mode with a seeded rng, timed and reported to the SANTA_SOLVE_HOOKS."""
+    stats = SolveStats(graph.n, "cycle" if single_cycle else "any", label)
+    started = time.perf_counter()
+    try:
+        with metrics.timed("solver"):
+            assignment = _solve_mode(graph, single_cycle, random.Random(seed), stats)
+    except SolverGaveUp:
+        stats.seconds = time.perf_counter() - started
+        _report(stats)  # feasible stays None: undecided
+        raise
+    stats.seconds = time.perf_counter() - started
+    stats.feasible = assignment is not None
+    _report(stats)
+    return assignment
+
+
+def _solve_cached(
+    graph: ConstraintGraph,
+    single_cycle: bool,
+    label: str = "",
+) -> Tuple[Optional[List[int]], Optional[int]]:
+    """(assignment, seed) with a fresh seed, reusing a cached dry-run witness if there is one."""
+    fp = solver_cache.fingerprint(graph, single_cycle)
+    cached = solver_cache.lookup(fp)
+    if cached is not None and (not cached["feasible"] or cached["assignment"] is not None):
+        # verdict, or witness left by the restrictions dry run
+        _report_cached(graph, single_cycle, cached["feasible"], label)
+        if not cached["feasible"]:
+            return None, None
+        assignment, seed = cached["assignment"], cached["seed"]
+    else:
+        seed = new_seed()
+        # a SolverGaveUp skips the store: only proved verdicts are cached
+        assignment = _solve_seeded(graph, single_cycle, seed, label)
+        if assignment is None:
+            solver_cache.store(fp, None)
+            return None, None
+    solver_cache.consume(fp)
+    return assignment, seed
+
+
+def generate_secret_santa_matches(
+    event: Event,
+    *,
+    seed: Optional[int] = None,
+    max_attempts: int = 2000,
+) -> Optional[Dict[Participant, Participant]]:
+    """
+    Returns a dict {giver_participant: receiver_participant} or None if impossible.
+
+    Builds the giver -> receiver "allowed" graph and looks for a perfect matching
+    with Hopcroft-Karp, so an impossible event is detected right away instead of
+    after thousands of retries. Events with LARGE_EVENT_THRESHOLD or more
+    participants use the sparse large-event solver. Events in "cycle" mode get
+    a single circle instead (see _single_cycle). A solution cached by the
+    restrictions dry run for the same constraints is reused (see solver_cache).
+    Exclusions with a penalty are soft: the cheapest assignment is picked (see
+    _solve_weighted). With event.history_mode on, pairings from the
+    organizer's earlier events are avoided (see with_history). max_attempts is kept for backwards
+    compatibility and no longer used.
+
+    The solve is deterministic given the participants, exclusions, history and seed.
+    Without a seed a fresh one is drawn (or the cached solution's seed is
+    reused); with one, the cache is bypassed. Either way the seed used is set
+    on event.match_seed, which the caller saves along with the matches.
+
+    Every solve (and cache hit) is reported as a SolveStats to the functions
+    listed in settings.SANTA_SOLVE_HOOKS; by default slow ones are logged.
+
+    Raises SolverGaveUp if a single circle was neither found nor ruled out.
+    """
+    participants: List[Participant] = list(event.participants.all().order_by("id"))
+    n = len(participants)
+    if n < 4:
+        return None
+
+    graph = event_graph(
+        participants,
+        Exclusion.objects.filter(event=event).values_list("giver_id", "excluded_id", "penalty"),
+    )
+    single_cycle = event.match_mode == Event.MODE_CYCLE
+    if event.history_mode != Event.HISTORY_OFF:
+        repeats = history.previous_pairs([(event, participants)])[event.id]
+        graph = with_history(graph, event.history_mode, repeats)
+
+    if seed is not None:
+        # replay: always solve, the cached witness may come from another seed
+        assignment = _solve_seeded(graph, single_cycle, seed, f"event {event.id}")
+    else:
+        assignment, seed = _solve_cached(graph, single_cycle, f"event {event.id}")
+    if assignment is None:
+        return None
+
+    event.match_seed = seed
+    return {participants[g]: participants[r] for g, r in enumerate(assignment)}
+
+def dry_run_matches_from_restrictions(
+    num_participants: int,
+    restrictions_map: Dict[int, Set[int]],
+    *,
+    max_attempts: int = 2000,
+    single_cycle: bool = False,
+    seed: Optional[int] = None,
+) -> Optional[Dict[int, int]]:
+    """
+    restrictions_map: giver_index -> set of forbidden receiver_indexes (should include self)
+    returns mapping giver_index -> receiver_index, or None if impossible
+    single_cycle: require one big circle (Event.MODE_CYCLE)
+    seed: solve with this seed instead of a fresh one (bypasses the cache)
+
+    Same matching engine as generate_secret_santa_matches; max_attempts is unused.
+    Verdicts and solutions are cached, so re-submitting the same form is free.
+    Raises SolverGaveUp like generate_secret_santa_matches.
+    """
+    graph = ConstraintGraph(num_participants, restrictions_map)
+    if seed is not None:
+        assignment = _solve_seeded(graph, single_cycle, seed, "dry run")
+        return None if assignment is None else dict(enumerate(assignment))
+
+    fp = solver_cache.fingerprint(graph, single_cycle)
+    cached = solver_cache.lookup(fp)
+    if cached is not None and (not cached["feasible"] or cached["assignment"] is not None):
+        _report_cached(graph, single_cycle, cached["feasible"], "dry run")
+        assignment = cached["assignment"]
+    else:
+        seed = new_seed()
+        # a SolverGaveUp skips the store, so a resubmit solves again
+        assignment = _solve_seeded(graph, single_cycle, seed, "dry run")
+        solver_cache.store(fp, assignment, seed)
+
+    if assignment is None:
+        return None
+
+    return dict(enumerate(assignment))
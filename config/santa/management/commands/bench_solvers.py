@@ -0,0 +1,59 @@
+import json
+import platform
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+
+from santa.benchmarks import KINDS, compare, make_cases, run_case
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark the match solvers on generated constraint graphs and emit JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 30, 100, 1000])
+        parser.add_argument("--densities", type=float, nargs="+", default=[0.0, 0.3, 0.7])
+        parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument("--compare", help="Earlier JSON report to compare wall times against.")
+
+    def handle(self, *args, **options):
+        cases = make_cases(options["sizes"], options["densities"], options["kinds"], options["seed"])
+        results = []
+        for case in cases:
+            row = run_case(case, repeat=options["repeat"])
+            results.append(row)
+            self.stderr.write(f"{row['case']}: {row['wall_ms']} ms, feasible={row['feasible']}")
+
+        report = {
+            "commit": current_commit(),
+            "python": platform.python_version(),
+            "results": results,
+        }
+
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Can't read {options['compare']}: {exc}")
+            report["baseline_commit"] = baseline.get("commit")
+            report["comparison"] = compare(results, baseline["results"])
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(text + "\n")
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,104 @@
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from santa.models import Event, Participant
+
+# Indexes added in migrations 0006 and 0012, dropped temporarily to show the "before" plans
+INDEXES = [
+    "participant_event_email_idx",
+    "participant_email_idx",
+    "santa_auth_user_email_upper_idx",
+    "event_organizer_date_idx",
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway dataset and print query plans of the hot lookups "
+        "(my events, an organizer's events page, participant by event+email, login by email) with and without "
+        "the hot-path indexes. Everything is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--participants", type=int, default=1_000_000)
+        parser.add_argument("--per-event", type=int, default=50)
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options)
+                self.report("after (with indexes)")
+
+                with connection.cursor() as cursor:
+                    for name in INDEXES:
+                        cursor.execute(f"DROP INDEX {name}")
+                    cursor.execute("ANALYZE")
+                self.report("before (no indexes)")
+
+                raise Rollback
+        except Rollback:
+            self.stdout.write("rolled back seeded data")
+
+    def seed(self, options):
+        batch = options["batch_size"]
+        per_event = options["per_event"]
+        total = options["participants"]
+        started = time.perf_counter()
+
+        organizer = User.objects.create_user(username="bench-organizer", email="bench-organizer@example.com")
+        users = [
+            User(username=f"bench{i}", email=f"Bench{i}@Example.com", password="!")
+            for i in range(options["users"])
+        ]
+        User.objects.bulk_create(users, batch_size=batch)
+
+        num_events = max(1, total // per_event)
+        events = Event.objects.bulk_create([
+            Event(organizer=organizer, event_name=f"Bench {i}", event_date=datetime.date(2026, 12, 24))
+            for i in range(num_events)
+        ], batch_size=batch)
+
+        rows = []
+        for i in range(total):
+            event = events[i // per_event % num_events]
+            rows.append(Participant(event=event, name=f"P{i}", email=f"bench{i % max(1, options['users'])}@example.com"))
+            if len(rows) == batch:
+                Participant.objects.bulk_create(rows)
+                rows = []
+        Participant.objects.bulk_create(rows)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        self.stdout.write(f"seeded {total} participants in {num_events} events in {time.perf_counter() - started:.1f}s")
+        self.organizer = organizer
+        self.sample_event = events[num_events // 2]
+
+    def report(self, title):
+        email = "bench7@example.com"
+        queries = {
+            "events for participant email": Event.objects.filter(participants__email=email).distinct(),
+            "organizer's events page (keyset)": Event.objects.filter(
+                organizer=self.organizer, event_date__lte=self.sample_event.event_date
+            ).order_by("-event_date", "-id").values_list("event_date", "id")[:21],
+            "participant by (event, email)": Participant.objects.filter(event=self.sample_event, email=email),
+            "login user by email (iexact)": User.objects.filter(email__iexact=email.upper()),
+        }
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"== {title} =="))
+        for label, queryset in queries.items():
+            started = time.perf_counter()
+            list(queryset)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(f"-- {label}: {elapsed:.2f} ms")
+            self.stdout.write(queryset.explain())
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from santa.models import Event
+from santa.services import BATCH_CHUNK_SIZE, generate_matches_for_events
+
+
+class Command(BaseCommand):
+    help = "Generate (or regenerate) the matches of many events in one pass and queue the match emails."
+
+    def add_arguments(self, parser):
+        parser.add_argument("event_ids", type=int, nargs="*")
+        parser.add_argument("--all", action="store_true", help="Every event instead of the listed ids.")
+        parser.add_argument("--workers", type=int, help="Solver processes (default: one per CPU, 1 = no pool).")
+        parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+        parser.add_argument("--no-email", action="store_true", help="Save the matches without queueing emails.")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            event_ids = list(Event.objects.order_by("id").values_list("id", flat=True))
+        else:
+            event_ids = options["event_ids"]
+        if not event_ids:
+            raise CommandError("Give some event ids or --all.")
+
+        result = generate_matches_for_events(
+            event_ids,
+            workers=options["workers"],
+            chunk_size=options["chunk_size"],
+            send_emails=not options["no_email"],
+        )
+
+        for event_id in result.infeasible:
+            self.stderr.write(f"event {event_id}: too many restrictions, matches left unchanged")
+        for event_id in result.busy:
+            self.stderr.write(f"event {event_id}: being generated right now, skipped")
+        for event_id in result.gave_up:
+            self.stderr.write(f"event {event_id}: no circle found within the search budget, try again")
+        missing = set(event_ids) - set(result.generated) - set(result.infeasible) - set(result.busy) - set(result.gave_up)
+        if missing:
+            self.stderr.write(f"unknown event ids: {', '.join(map(str, sorted(missing)))}")
+
+        self.stdout.write(
+            f"generated {len(result.generated)} events, {len(result.infeasible)} infeasible "
+            f"in {result.seconds:.2f}s ({result.events_per_second:.1f} events/sec)"
+        )
@@ -0,0 +1,19 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from santa.models import EventDraft
+
+
+class Command(BaseCommand):
+    help = "Delete create-event wizard drafts nobody has touched for a while (run daily, e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.SANTA_DRAFT_MAX_AGE_DAYS)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options["days"])
+        deleted, _ = EventDraft.objects.filter(updated_at__lt=cutoff).delete()
+        self.stdout.write(f"deleted {deleted} drafts older than {options['days']} days")
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from santa import page_cache
+from santa.logic import SolverGaveUp, generate_secret_santa_matches
+from santa.models import Event, Match
+from santa.outbox import enqueue_match_emails
+
+
+class Command(BaseCommand):
+    help = (
+        "Redraw an event's matches from its stored seed and check them against the saved ones. "
+        "Restores them if none are saved; --resend queues the match emails again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("event_id", type=int)
+        parser.add_argument("--resend", action="store_true", help="Queue the match emails again.")
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.get(id=options["event_id"])
+        except Event.DoesNotExist:
+            raise CommandError(f"No event {options['event_id']}.")
+        if event.match_seed is None:
+            raise CommandError(f"Event {event.id} has no recorded seed (matches never generated, or generated before seeds were stored).")
+
+        try:
+            matches = generate_secret_santa_matches(event, seed=event.match_seed)
+        except SolverGaveUp:
+            raise CommandError(f"Replay of event {event.id} found no circle within the search budget.")
+        if matches is None:
+            raise CommandError(f"Event {event.id} has no valid matches for its current participants and exclusions.")
+
+        with transaction.atomic():
+            saved = dict(Match.objects.filter(event=event).values_list("giver_id", "receiver_id"))
+            replayed = {giver.id: receiver.id for giver, receiver in matches.items()}
+            if saved and saved != replayed:
+                raise CommandError(
+                    f"Replay of event {event.id} differs from the saved matches; "
+                    "participants or exclusions probably changed since they were generated."
+                )
+            if not saved:
+                Match.objects.bulk_create([
+                    Match(event=event, giver=giver, receiver=receiver) for giver, receiver in matches.items()
+                ])
+                page_cache.invalidate(event.id)
+                self.stdout.write(f"restored {len(matches)} matches of event {event.id}")
+            else:
+                self.stdout.write(f"replayed {len(matches)} matches of event {event.id}: identical (seed {event.match_seed})")
+
+            if options["resend"]:
+                queued = enqueue_match_emails(event, matches)
+                self.stdout.write(f"queued {queued} emails")
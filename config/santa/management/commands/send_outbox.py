@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from santa.outbox import deliver_pending
+
+
+class Command(BaseCommand):
+    help = "Send queued match emails from the outbox (use --loop to run as a worker)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when the outbox is empty.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to sleep when nothing is due (with --loop).")
+        parser.add_argument("--batch-size", type=int, default=settings.SANTA_OUTBOX_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = deliver_pending(options["batch_size"])
+            except Exception as exc:
+                if not options["loop"]:
+                    raise
+                # e.g. the database went away; claimed rows come due again after CLAIM_SECONDS
+                self.stderr.write(f"batch failed: {exc!r}")
+                time.sleep(options["interval"])
+                continue
+            if sent or failed:
+                self.stdout.write(f"sent {sent}, failed {failed}")
+                continue  # more may be due right away
+
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,192 @@
+"""
+Request-level performance metrics, off unless SANTA_METRICS_ENABLED.
+
+MetricsMiddleware times every request and, through connection.execute_wrapper,
+its database queries; timed("solver") / timed("smtp") blocks in santa.logic
+and santa.outbox add their share. Each response gets a Server-Timing header
+(visible in the browser dev tools) and the totals are served in Prometheus
+text format by metrics_view.
+
+Numbers are kept per process: with several gunicorn workers every scrape sees
+one of them, and the outbox worker's SMTP timings stay in its own process.
+When disabled the middleware removes itself (MiddlewareNotUsed) and timed()
+only checks a setting.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+# Latency histogram buckets (seconds), Prometheus style
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-request totals: {"db": [count, seconds], "solver": [count, seconds], ...}
+_current: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar("santa_metrics", default=None)
+
+
+class Registry:
+    """Process-wide counters, safe to update from several threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests: Dict[Tuple[str, str], int] = {}      # (view, method) -> count
+            self.latency: Dict[str, List[float]] = {}           # view -> bucket counts + [sum, count]
+            self.work: Dict[Tuple[str, str], List[float]] = {}  # (kind, view) -> [count, seconds]
+
+    def observe_request(self, view: str, method: str, seconds: float, work: Dict[str, List[float]]) -> None:
+        with self._lock:
+            self.requests[(view, method)] = self.requests.get((view, method), 0) + 1
+            histogram = self.latency.setdefault(view, [0] * len(BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            for kind, (count, spent) in work.items():
+                totals = self.work.setdefault((kind, view), [0, 0.0])
+                totals[0] += count
+                totals[1] += spent
+
+    def observe_work(self, kind: str, seconds: float, count: int = 1) -> None:
+        # outside of a request (management commands, the outbox worker)
+        with self._lock:
+            totals = self.work.setdefault((kind, ""), [0, 0.0])
+            totals[0] += count
+            totals[1] += seconds
+
+    def render(self) -> str:
+        lines = [
+            "# HELP santa_requests_total Requests handled, by view and method.",
+            "# TYPE santa_requests_total counter",
+        ]
+        with self._lock:
+            for (view, method), count in sorted(self.requests.items()):
+                lines.append(f'santa_requests_total{{view="{view}",method="{method}"}} {count}')
+
+            lines += [
+                "# HELP santa_request_seconds Request latency, by view.",
+                "# TYPE santa_request_seconds histogram",
+            ]
+            for view, histogram in sorted(self.latency.items()):
+                for bound, count in zip(BUCKETS, histogram):
+                    lines.append(f'santa_request_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+                lines.append(f'santa_request_seconds_bucket{{view="{view}",le="+Inf"}} {histogram[-1]}')
+                lines.append(f'santa_request_seconds_sum{{view="{view}"}} {histogram[-2]:.6f}')
+                lines.append(f'santa_request_seconds_count{{view="{view}"}} {histogram[-1]}')
+
+            kinds = sorted({kind for kind, _ in self.work})
+            for kind in kinds:
+                lines += [
+                    f"# HELP santa_{kind}_total {kind} calls, by view (empty: outside requests).",
+                    f"# TYPE santa_{kind}_total counter",
+                ]
+                for (k, view), (count, _) in sorted(self.work.items()):
+                    if k == kind:
+                        lines.append(f'santa_{kind}_total{{view="{view}"}} {int(count)}')
+                lines += [
+                    f"# HELP santa_{kind}_seconds_total Time spent in {kind}, by view.",
+                    f"# TYPE santa_{kind}_seconds_total counter",
+                ]
+                for (k, view), (_, spent) in sorted(self.work.items()):
+                    if k == kind:
+                        lines.append(f'santa_{kind}_seconds_total{{view="{view}"}} {spent:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _add(kind: str, seconds: float, count: int = 1) -> None:
+    work = _current.get()
+    if work is None:
+        registry.observe_work(kind, seconds, count)
+        return
+    totals = work.setdefault(kind, [0, 0.0])
+    totals[0] += count
+    totals[1] += seconds
+
+
+@contextmanager
+def timed(kind: str, count: int = 1):
+    """Adds the block's wall time to `kind` ("solver", "smtp", ...) of the current request."""
+    if not settings.SANTA_METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add(kind, time.perf_counter() - started, count)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SANTA_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        work: Dict[str, List[float]] = {}
+        token = _current.set(work)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self._time_query):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, work, started)
+
+    async def __acall__(self, request):
+        work: Dict[str, List[float]] = {}
+        token = _current.set(work)
+        started = time.perf_counter()
+        # the request's queries run in its sync_to_async thread, so the wrapper goes there
+        wrapper = await sync_to_async(self._wrap_queries)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrapper.__exit__)(None, None, None)
+            _current.reset(token)
+        return self._finish(request, response, work, started)
+
+    def _wrap_queries(self):
+        wrapper = connection.execute_wrapper(self._time_query)
+        wrapper.__enter__()
+        return wrapper
+
+    def _finish(self, request, response, work, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = (match.view_name if match else "") or "unmatched"
+        registry.observe_request(view, request.method, elapsed, work)
+
+        timings = [f"app;dur={elapsed * 1000:.1f}"]
+        for kind, (count, spent) in sorted(work.items()):
+            timings.append(f'{kind};dur={spent * 1000:.1f};desc="{int(count)} calls"')
+        response["Server-Timing"] = ", ".join(timings)
+        return response
+
+    def _time_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            _add("db", time.perf_counter() - started)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("santa", "0003_match_unique_giver_per_event_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="match_mode",
+            field=models.CharField(
+                choices=[("any", "Any pairing"), ("cycle", "One big circle")],
+                default="any",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-18 17:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+# login/signup match emails case-insensitively (email__iexact -> UPPER(email) = UPPER(%s)),
+# auth_user belongs to django.contrib.auth so the index is added with plain SQL
+USER_EMAIL_INDEX = "santa_auth_user_email_upper_idx"
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("santa", "0005_outboundemail"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="participant",
+            index=models.Index(
+                fields=["event", "email"], name="participant_event_email_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="participant",
+            index=models.Index(fields=["email"], name="participant_email_idx"),
+        ),
+        migrations.RunSQL(
+            sql=f"CREATE INDEX {USER_EMAIL_INDEX} ON auth_user (UPPER(email))",
+            reverse_sql=f"DROP INDEX {USER_EMAIL_INDEX}",
+        ),
+    ]
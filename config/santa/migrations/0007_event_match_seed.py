@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("santa", "0006_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="match_seed",
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
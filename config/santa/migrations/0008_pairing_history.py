@@ -0,0 +1,92 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_history(apps, schema_editor):
+    Match = apps.get_model("santa", "Match")
+    PairingHistory = apps.get_model("santa", "PairingHistory")
+
+    matches = Match.objects.values_list(
+        "event_id", "event__organizer_id", "event__event_date", "giver__email", "receiver__email"
+    ).order_by("id")
+    rows = []
+    for event_id, organizer_id, event_date, giver_email, receiver_email in matches.iterator(chunk_size=2000):
+        rows.append(PairingHistory(
+            organizer_id=organizer_id,
+            event_id=event_id,
+            event_date=event_date,
+            giver_email=giver_email.lower(),
+            receiver_email=receiver_email.lower(),
+        ))
+        if len(rows) == 2000:
+            PairingHistory.objects.bulk_create(rows)
+            rows = []
+    PairingHistory.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("santa", "0007_event_match_seed"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="history_mode",
+            field=models.CharField(
+                choices=[
+                    ("off", "Allow repeats"),
+                    ("soft", "Avoid repeats if possible"),
+                    ("hard", "Never repeat"),
+                ],
+                default="off",
+                max_length=10,
+            ),
+        ),
+        migrations.CreateModel(
+            name="PairingHistory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event_date", models.DateField()),
+                ("giver_email", models.EmailField(max_length=254)),
+                ("receiver_email", models.EmailField(max_length=254)),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pairing_history",
+                        to="santa.event",
+                    ),
+                ),
+                (
+                    "organizer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pairing_history",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["organizer", "giver_email", "event_date"],
+                        name="history_lookup_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("santa", "0008_pairing_history"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exclusion",
+            name="penalty",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
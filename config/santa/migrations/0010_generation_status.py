@@ -0,0 +1,42 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+def mark_generated(apps, schema_editor):
+    Event = apps.get_model("santa", "Event")
+    Event.objects.filter(matches__isnull=False).distinct().update(generation_status="done")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("santa", "0009_exclusion_penalty"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="generation_started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="generation_status",
+            field=models.CharField(
+                choices=[
+                    ("idle", "Not generated"),
+                    ("running", "Generating"),
+                    ("done", "Generated"),
+                    ("failed", "Too many restrictions"),
+                ],
+                default="idle",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="generation_token",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(mark_generated, migrations.RunPython.noop),
+    ]
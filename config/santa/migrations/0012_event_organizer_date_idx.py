@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("santa", "0011_eventdraft"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["organizer", "event_date", "id"],
+                name="event_organizer_date_idx",
+            ),
+        ),
+    ]
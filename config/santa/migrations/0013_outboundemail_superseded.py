@@ -0,0 +1,26 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("santa", "0012_event_organizer_date_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outboundemail",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("sent", "Sent"),
+                    ("failed", "Failed"),
+                    ("superseded", "Superseded"),
+                ],
+                default="pending",
+                max_length=10,
+            ),
+        ),
+    ]
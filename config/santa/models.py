@@ -1,7 +1,33 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Event(models.Model):
+    MODE_ANY = "any"
+    MODE_CYCLE = "cycle"
+    MATCH_MODE_CHOICES = [
+        (MODE_ANY, "Any pairing"),
+        (MODE_CYCLE, "One big circle"),
+    ]
+    HISTORY_OFF = "off"
+    HISTORY_SOFT = "soft"
+    HISTORY_HARD = "hard"
+    HISTORY_MODE_CHOICES = [
+        (HISTORY_OFF, "Allow repeats"),
+        (HISTORY_SOFT, "Avoid repeats if possible"),
+        (HISTORY_HARD, "Never repeat"),
+    ]
+    GENERATION_IDLE = "idle"
+    GENERATION_RUNNING = "running"
+    GENERATION_DONE = "done"
+    GENERATION_FAILED = "failed"
+    GENERATION_STATUS_CHOICES = [
+        (GENERATION_IDLE, "Not generated"),
+        (GENERATION_RUNNING, "Generating"),
+        (GENERATION_DONE, "Generated"),
+        (GENERATION_FAILED, "Too many restrictions"),
+    ]
+
     event_name = models.CharField(max_length=30)
     organizer = models.ForeignKey(
         User,
@@ -13,6 +39,22 @@ class Event(models.Model):
     time = models.TimeField(blank=True, null=True)
     location = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # "cycle" = gifts pass around a single circle (A -> B -> C -> ... -> A)
+    match_mode = models.CharField(max_length=10, choices=MATCH_MODE_CHOICES, default=MODE_ANY)
+    # seed the current matches were drawn with, replay_matches redraws them from it
+    match_seed = models.BigIntegerField(null=True, blank=True, editable=False)
+    # avoid pairings from the organizer's earlier events (see santa.history)
+    history_mode = models.CharField(max_length=10, choices=HISTORY_MODE_CHOICES, default=HISTORY_OFF)
+    # match generation: the token of the generate form last handled, so a
+    # double click or retry doesn't solve and send everything twice
+    generation_status = models.CharField(max_length=10, choices=GENERATION_STATUS_CHOICES, default=GENERATION_IDLE)
+    generation_token = models.CharField(max_length=64, blank=True)
+    generation_started_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [  # "my events" pages through an organizer's events by (event_date, id)
+            models.Index(fields=["organizer", "event_date", "id"], name="event_organizer_date_idx"),
+        ]
 
     def __str__(self):
         return self.event_name
@@ -23,6 +65,12 @@ class Participant(models.Model):
     name = models.CharField(max_length=50)
     email = models.EmailField()
 
+    class Meta:
+        indexes = [ #"my events" looks people up by email, event page by (event, email)
+            models.Index(fields=["event", "email"], name="participant_event_email_idx"),
+            models.Index(fields=["email"], name="participant_email_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.email})"
     
@@ -47,6 +95,8 @@ class Exclusion(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="exclusions")
     giver = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name="exclusions_as_giver")
     excluded = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name="excluded_by")
+    # empty = never allowed; a number = allowed if unavoidable, at this cost
+    penalty = models.PositiveIntegerField(null=True, blank=True)
 
     class Meta:
         constraints = [
@@ -54,8 +104,74 @@ class Exclusion(models.Model):
         ]
 
     def __str__(self):
+        if self.penalty is not None:
+            return f"{self.giver.name} should avoid drawing {self.excluded.name} (penalty {self.penalty})"
         return f"{self.giver.name} cannot draw {self.excluded.name}"
 
+#who drew whom in past events, by email, so later events can avoid repeats
+#(kept in sync with Match by santa.history.record_pairings)
+class PairingHistory(models.Model):
+    organizer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="pairing_history")
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="pairing_history")
+    event_date = models.DateField()
+    giver_email = models.EmailField()
+    receiver_email = models.EmailField()
+
+    class Meta:
+        indexes = [ #generation looks up one organizer's recent pairings for a set of givers
+            models.Index(fields=["organizer", "giver_email", "event_date"], name="history_lookup_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.giver_email} → {self.receiver_email} ({self.event_date})"
+
+
+#create/restrictions wizard state until the event is saved; the session only
+#holds its id (python manage.py purge_drafts removes abandoned ones)
+class EventDraft(models.Model):
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="event_drafts")
+    event_data = models.JSONField(default=dict)
+    participants = models.JSONField(default=list)  # [{"name", "email"}] in form order
+    matcher_state = models.JSONField(null=True, blank=True)  # IncrementalMatcher.to_state() for the live check
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Draft {self.event_data.get('event_name', '')} by {self.owner}"
+
+
+#match emails waiting to be sent by the outbox worker (python manage.py send_outbox)
+class OutboundEmail(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_SUPERSEDED = "superseded"  # still pending when the matches were regenerated
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+        (STATUS_SUPERSEDED, "Superseded"),
+    ]
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="outbound_emails")
+    participant = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name="outbound_emails")
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [ #the worker polls for due pending rows
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} ({self.status})"
+
 #class Wishlist(models.Model):
  #   pass
 
@@ -0,0 +1,234 @@
+"""
+Match email outbox.
+
+generate_matches_view only writes OutboundEmail rows in the same transaction as
+the matches; the worker (python manage.py send_outbox --loop) sends them later
+over one SMTP connection per batch, retrying failures with exponential backoff.
+With SANTA_SMTP_CONCURRENCY > 1 a batch goes out over that many connections at
+once through aiosmtplib instead.
+
+Regenerating marks the emails still pending as superseded rather than deleting
+them, since a worker may have claimed them already: it drops superseded rows
+from its batch before sending, and its status updates tolerate rows that
+changed or are gone.
+"""
+import asyncio
+import datetime
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import Event, OutboundEmail, Participant
+
+# While a worker is sending a claimed batch, other workers leave it alone this long
+CLAIM_SECONDS = 5 * 60
+
+
+def build_match_email(event: Event, giver: Participant, receiver: Participant) -> Tuple[str, str]:
+    """Returns (subject, body) of the email telling giver who they drew."""
+    login_link = f"{settings.SITE_URL}/login/"
+    subject = f"Your Secret Santa match for {event.event_name}"
+    body = (
+        f"Hi {giver.name},\n\n"
+        f"You are getting a gift for: {receiver.name}.\n\n"
+        f"Event details:\n"
+        f"- Date: {event.event_date}\n"
+        f"- Time: {event.time or '-'}\n"
+        f"- Location: {event.location or '-'}\n"
+        f"- Budget: {event.budget or '-'}\n\n"
+        f"You can also log in using this email ({giver.email}) to view your match at {login_link}.\n"
+    )
+    return subject, body
+
+
+def enqueue_match_emails(event: Event, matches: Dict[Participant, Participant]) -> int:
+    """
+    Queue one email per giver. Call inside the transaction that saves the
+    matches; emails still pending from an earlier generation are superseded.
+    """
+    supersede_pending(event_id=event.id)
+
+    rows = match_email_rows(event, matches)
+    OutboundEmail.objects.bulk_create(rows)
+    return len(rows)
+
+
+def match_email_rows(event: Event, matches: Dict[Participant, Participant]) -> List[OutboundEmail]:
+    """Unsaved outbox rows for enqueue_match_emails (or a batch insert)."""
+    rows = []
+    for giver, receiver in matches.items():
+        subject, body = build_match_email(event, giver, receiver)
+        rows.append(OutboundEmail(
+            event=event,
+            participant=giver,
+            to_email=giver.email,
+            subject=subject,
+            body=body,
+        ))
+    return rows
+
+
+def supersede_pending(**filters) -> int:
+    """Stop the pending emails matching filters (e.g. event_id__in=...) from going out."""
+    return OutboundEmail.objects.filter(status=OutboundEmail.STATUS_PENDING, **filters).update(
+        status=OutboundEmail.STATUS_SUPERSEDED
+    )
+
+
+def _claim_batch(batch_size: int):
+    """Lock due rows, push their next attempt into the future and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        if batch:
+            OutboundEmail.objects.filter(id__in=[row.id for row in batch]).update(
+                next_attempt_at=now + datetime.timedelta(seconds=CLAIM_SECONDS)
+            )
+    return batch
+
+
+def _still_pending(batch: List[OutboundEmail]) -> List[OutboundEmail]:
+    """The claimed rows that were not superseded (or deleted) since the claim."""
+    pending = set(
+        OutboundEmail.objects
+        .filter(id__in=[row.id for row in batch], status=OutboundEmail.STATUS_PENDING)
+        .values_list("id", flat=True)
+    )
+    return [row for row in batch if row.id in pending]
+
+
+# Both update nothing when the row was superseded or deleted meanwhile.
+def _mark_failed_attempt(row: OutboundEmail, error: Exception) -> None:
+    row.attempts += 1
+    row.last_error = str(error)[:1000]
+    if row.attempts >= settings.SANTA_OUTBOX_MAX_ATTEMPTS:
+        row.status = OutboundEmail.STATUS_FAILED
+    else:
+        # exponential backoff: base, 2*base, 4*base, ...
+        delay = settings.SANTA_OUTBOX_RETRY_SECONDS * (2 ** (row.attempts - 1))
+        row.next_attempt_at = timezone.now() + datetime.timedelta(seconds=delay)
+    OutboundEmail.objects.filter(id=row.id, status=OutboundEmail.STATUS_PENDING).update(
+        attempts=row.attempts, last_error=row.last_error, status=row.status, next_attempt_at=row.next_attempt_at
+    )
+
+
+def _mark_sent(row: OutboundEmail) -> None:
+    # also over "superseded": the email did go out
+    row.attempts += 1
+    row.status = OutboundEmail.STATUS_SENT
+    row.sent_at = timezone.now()
+    row.last_error = ""
+    OutboundEmail.objects.filter(id=row.id).update(
+        attempts=row.attempts, status=row.status, sent_at=row.sent_at, last_error=""
+    )
+
+
+async def _send_concurrently(batch: List[OutboundEmail], from_email: str, concurrency: int) -> List[Optional[Exception]]:
+    """
+    Sends the batch over up to `concurrency` SMTP connections at once, each
+    taking the next row when it is done with one. Returns each row's error,
+    None for the rows that went out.
+    """
+    import aiosmtplib  # only needed with SANTA_SMTP_CONCURRENCY > 1
+
+    errors: List[Optional[Exception]] = [None] * len(batch)
+    todo = deque(range(len(batch)))
+
+    async def sender() -> Optional[Exception]:
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.EMAIL_HOST,
+            port=settings.EMAIL_PORT,
+            username=settings.EMAIL_HOST_USER or None,
+            password=settings.EMAIL_HOST_PASSWORD or None,
+            use_tls=settings.EMAIL_USE_SSL,
+            start_tls=settings.EMAIL_USE_TLS,
+            timeout=settings.EMAIL_TIMEOUT,
+        )
+        try:
+            await smtp.connect()
+        except Exception as exc:
+            return exc
+        try:
+            while todo:
+                i = todo.popleft()
+                row = batch[i]
+                message = EmailMessage(row.subject, row.body, from_email, [row.to_email]).message()
+                try:
+                    with metrics.timed("smtp"):
+                        await smtp.send_message(message)
+                except Exception as exc:
+                    errors[i] = exc
+        finally:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+        return None
+
+    connect_errors = await asyncio.gather(*(sender() for _ in range(min(concurrency, len(batch)))))
+    # rows no connection got to (SMTP down) retry later with the connect error
+    for i in todo:
+        errors[i] = next(exc for exc in connect_errors if exc is not None)
+    return errors
+
+
+def deliver_pending(batch_size: int = None) -> Tuple[int, int]:
+    """
+    Sends one batch of due emails over a single SMTP connection, or over
+    SANTA_SMTP_CONCURRENCY connections in parallel.
+    Returns (sent, failed_attempts).
+    """
+    batch = _claim_batch(batch_size or settings.SANTA_OUTBOX_BATCH_SIZE)
+    if batch:
+        batch = _still_pending(batch)  # the claim's transaction is over, a regeneration may have run
+    if not batch:
+        return 0, 0
+
+    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", None)
+    if settings.SANTA_SMTP_CONCURRENCY > 1:
+        errors = asyncio.run(_send_concurrently(batch, from_email, settings.SANTA_SMTP_CONCURRENCY))
+        for row, error in zip(batch, errors):
+            if error is None:
+                _mark_sent(row)
+            else:
+                _mark_failed_attempt(row, error)
+        failed = sum(error is not None for error in errors)
+        return len(batch) - failed, failed
+
+    connection = get_connection(fail_silently=False)
+    sent = failed = 0
+
+    try:
+        connection.open()
+    except Exception as exc:  # SMTP down: the whole batch retries later
+        for row in batch:
+            _mark_failed_attempt(row, exc)
+        return 0, len(batch)
+
+    try:
+        for row in batch:
+            message = EmailMessage(row.subject, row.body, from_email, [row.to_email], connection=connection)
+            try:
+                with metrics.timed("smtp"):
+                    connection.send_messages([message])
+            except Exception as exc:
+                _mark_failed_attempt(row, exc)
+                failed += 1
+                continue
+
+            _mark_sent(row)
+            sent += 1
+    finally:
+        connection.close()
+
+    return sent, failed
@@ -0,0 +1,119 @@
+"""
+Pre-rendered fragments of the event page, per event and viewer.
+
+An event's page only changes when the event, its participants, exclusions or
+matches change, yet everybody opens it at once when the match emails go out.
+event_view keeps the rendered pieces in the Django cache: the details and
+participant list (same for everybody), the organizer's match list and one
+"your match" box per participant. Email delivery status and the generate form
+(CSRF token) are rendered on every hit.
+
+event_view is async, so it uses the a-prefixed versions of these.
+
+Every event has a version number in the cache and fragments are stored under
+it, so invalidate() drops all of an event's fragments by bumping one counter.
+Model saves and deletes do it through signals (santa/signals.py); bulk
+operations and queryset deletes call invalidate() themselves.
+
+The bump has to reach every process serving the page, so this is off
+(SANTA_EVENT_PAGE_CACHE) unless the cache backend is shared: with LocMemCache a
+generation in another worker or in manage.py would leave stale pages behind.
+When off, nothing is read or stored and every hit renders the page.
+"""
+import time
+from typing import Dict, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+KEY_PREFIX = "santa:event:"
+
+
+def _version_key(event_id: int) -> str:
+    return f"{KEY_PREFIX}{event_id}:version"
+
+
+def enabled() -> bool:
+    return settings.SANTA_EVENT_PAGE_CACHE
+
+
+def version(event_id: int) -> int:
+    """The event's current version, to read and store its fragments under."""
+    if not enabled():
+        return 0
+    key = _version_key(event_id)
+    current = cache.get(key)
+    if current is None:
+        # never a number used before, in case the counter was evicted
+        current = time.time_ns()
+        if not cache.add(key, current, timeout=None):
+            current = cache.get(key, current)
+    return current
+
+
+def get(event_id: int, version: int, names: Iterable[str]) -> Dict[str, object]:
+    """{name: fragment} for the fragments that are cached."""
+    if not enabled():
+        return {}
+    prefix = f"{KEY_PREFIX}{event_id}:{version}:"
+    found = cache.get_many([prefix + name for name in names])
+    return {key[len(prefix):]: value for key, value in found.items()}
+
+
+def store(event_id: int, version: int, fragments: Dict[str, object]) -> None:
+    if not enabled():
+        return
+    prefix = f"{KEY_PREFIX}{event_id}:{version}:"
+    cache.set_many(
+        {prefix + name: value for name, value in fragments.items()},
+        timeout=settings.SANTA_EVENT_PAGE_CACHE_TIMEOUT,
+    )
+
+
+async def aversion(event_id: int) -> int:
+    if not enabled():
+        return 0
+    key = _version_key(event_id)
+    current = await cache.aget(key)
+    if current is None:
+        current = time.time_ns()
+        if not await cache.aadd(key, current, timeout=None):
+            current = await cache.aget(key, current)
+    return current
+
+
+async def aget(event_id: int, version: int, names: Iterable[str]) -> Dict[str, object]:
+    if not enabled():
+        return {}
+    prefix = f"{KEY_PREFIX}{event_id}:{version}:"
+    found = await cache.aget_many([prefix + name for name in names])
+    return {key[len(prefix):]: value for key, value in found.items()}
+
+
+async def astore(event_id: int, version: int, fragments: Dict[str, object]) -> None:
+    if not enabled():
+        return
+    prefix = f"{KEY_PREFIX}{event_id}:{version}:"
+    await cache.aset_many(
+        {prefix + name: value for name, value in fragments.items()},
+        timeout=settings.SANTA_EVENT_PAGE_CACHE_TIMEOUT,
+    )
+
+
+def _bump(event_ids: Iterable[int]) -> None:
+    for event_id in event_ids:
+        try:
+            cache.incr(_version_key(event_id))
+        except ValueError:  # no version, so nothing cached
+            pass
+
+
+def invalidate(*event_ids: int) -> None:
+    """Forget the cached pages of these events, now and again after commit."""
+    if not enabled():
+        return
+    _bump(event_ids)
+    if connection.in_atomic_block:
+        # a page rendered from the old rows before the commit must not stick
+        transaction.on_commit(lambda: _bump(event_ids))
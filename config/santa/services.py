@@ -0,0 +1,328 @@
+"""
+Write-side helpers shared by the views (and management commands).
+"""
+import datetime
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import history, page_cache, solver_cache
+from .logic import ConstraintGraph, SolverGaveUp, _solve_seeded, event_graph, new_seed, with_history
+from .models import Event, Exclusion, Match, OutboundEmail, PairingHistory, Participant
+from .outbox import enqueue_match_emails, match_email_rows, supersede_pending
+
+# Events loaded, solved and written together by generate_matches_for_events
+BATCH_CHUNK_SIZE = 100
+
+
+@transaction.atomic
+def create_event_with_participants(
+    organizer: User,
+    event_data: dict,
+    participants: List[dict],
+    restrictions_map: Dict[int, Set[int]],
+    *,
+    batch_size: Optional[int] = None,
+) -> Event:
+    """
+    Saves the event from the create/restrictions wizard in three INSERTs
+    (or a few more with batch_size, for big imports).
+
+    participants: list of {"name", "email"} in form order
+    restrictions_map: giver_index -> excluded indexes, already validated by the
+    restrictions step (self-exclusions are skipped)
+    """
+    event = Event.objects.create(
+        organizer=organizer,
+        event_name=event_data["event_name"],
+        event_date=event_data["event_date"],
+        time=event_data.get("event_time") or None,
+        location=event_data.get("event_location", ""),
+        budget=event_data.get("event_budget", ""),
+        match_mode=event_data.get("match_mode", Event.MODE_ANY),
+        history_mode=event_data.get("history_mode", Event.HISTORY_OFF),
+    )
+
+    # bulk_create fills in primary keys (Postgres / SQLite 3.35+), in form order
+    participant_objs = Participant.objects.bulk_create([
+        Participant(event=event, name=p["name"], email=p["email"])
+        for p in participants
+    ], batch_size=batch_size)
+
+    exclusions = [
+        Exclusion(event=event, giver=participant_objs[giver_index], excluded=participant_objs[excluded_index])
+        for giver_index, excluded in restrictions_map.items()
+        for excluded_index in sorted(excluded)
+        if excluded_index != giver_index
+    ]
+    Exclusion.objects.bulk_create(exclusions, batch_size=batch_size)
+    page_cache.invalidate(event.id)
+
+    return event
+
+
+def _generation_running(event: Event) -> bool:
+    # a generation older than SANTA_GENERATION_TIMEOUT is assumed to have crashed
+    started = event.generation_started_at
+    timeout = datetime.timedelta(seconds=settings.SANTA_GENERATION_TIMEOUT)
+    return event.generation_status == Event.GENERATION_RUNNING and started is not None and timezone.now() - started < timeout
+
+
+def claim_generation(event_id: int, token: str) -> Optional[str]:
+    """
+    Takes the event's generation slot under the generate form's idempotency
+    token, with the event row locked so concurrent requests go one at a time.
+
+    Returns None when the caller should solve (and then call
+    save_generated_matches), otherwise why this request is a duplicate:
+    GENERATION_RUNNING if another request is generating right now, or the
+    finished status if this token was already handled. An empty token only
+    gets the running check.
+    """
+    with transaction.atomic():
+        event = Event.objects.select_for_update().get(id=event_id)
+        if _generation_running(event):
+            return Event.GENERATION_RUNNING
+        if token and token == event.generation_token and event.generation_status != Event.GENERATION_RUNNING:
+            return event.generation_status
+
+        event.generation_status = Event.GENERATION_RUNNING
+        event.generation_token = token
+        event.generation_started_at = timezone.now()
+        event.save(update_fields=["generation_status", "generation_token", "generation_started_at"])
+    return None
+
+
+@transaction.atomic
+def save_generated_matches(event: Event, matches: Optional[Dict[Participant, Participant]]) -> int:
+    """
+    Ends a generation started by claim_generation: replaces the matches, their
+    pairing history and the queued emails (matches None = infeasible, nothing
+    changes but the status). Returns the number of emails queued.
+    """
+    Event.objects.select_for_update().filter(id=event.id).first()
+    if matches is None:
+        event.generation_status = Event.GENERATION_FAILED
+        event.save(update_fields=["generation_status"])
+        return 0
+
+    Match.objects.filter(event=event).delete()
+    Match.objects.bulk_create([
+        Match(event=event, giver=giver, receiver=receiver) for giver, receiver in matches.items()
+    ])
+    page_cache.invalidate(event.id)
+    history.record_pairings(event, matches)
+
+    event.generation_status = Event.GENERATION_DONE
+    # match_seed was set by generate_secret_santa_matches (for replay_matches)
+    event.save(update_fields=["generation_status", "match_seed"])
+
+    # Emails are only queued here; the outbox worker sends them after commit
+    return enqueue_match_emails(event, matches)
+
+
+class BatchResult(NamedTuple):
+    generated: List[int]
+    infeasible: List[int]
+    busy: List[int]  # being generated by someone else, left alone
+    gave_up: List[int]  # no circle found but none ruled out either, left as they were
+    seconds: float
+
+    @property
+    def events_per_second(self) -> float:
+        done = len(self.generated) + len(self.infeasible)
+        return done / self.seconds if self.seconds else 0.0
+
+
+def _solve_job(job: Tuple[int, ConstraintGraph, bool, int]) -> Tuple[int, Optional[List[int]], bool]:
+    # runs in a pool worker: only picklable data goes in and out.
+    # Returns (event id, assignment, whether the solver gave up).
+    event_id, graph, single_cycle, seed = job
+    try:
+        return event_id, _solve_seeded(graph, single_cycle, seed, f"event {event_id}"), False
+    except SolverGaveUp:
+        return event_id, None, True
+
+
+def generate_matches_for_events(
+    event_ids: Iterable[int],
+    *,
+    workers: Optional[int] = None,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    send_emails: bool = True,
+) -> BatchResult:
+    """
+    (Re)generates the matches of many events at once, like generate_matches_view
+    does for one: old matches and their pairing history are replaced and match
+    emails queued. Events with history_mode on avoid earlier pairings.
+
+    Per chunk of events, participants, exclusions and pairing history are read
+    in one query each, the solves run in a process pool (workers=None: one per CPU,
+    workers=1: in this process) and all Match / OutboundEmail rows are written
+    with one bulk_create each in a single transaction, together with each
+    event's match_seed (see replay_matches). Events with fewer than
+    4 participants or impossible restrictions are reported as infeasible and
+    keep their old matches. Unknown ids are skipped.
+
+    Each chunk's events are claimed like claim_generation does for a generate
+    click; events already being generated are reported as busy and untouched.
+    """
+    started = time.perf_counter()
+    ids = list(dict.fromkeys(event_ids))
+    generated: List[int] = []
+    infeasible: List[int] = []
+    busy: List[int] = []
+    gave_up: List[int] = []
+
+    executor = None
+    if workers is None or workers > 1:
+        # workers import santa.logic, which needs the app registry
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+    try:
+        for start in range(0, len(ids), chunk_size):
+            chunk = _generate_chunk(ids[start:start + chunk_size], executor, send_emails)
+            generated.extend(chunk.generated)
+            infeasible.extend(chunk.infeasible)
+            busy.extend(chunk.busy)
+            gave_up.extend(chunk.gave_up)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return BatchResult(generated, infeasible, busy, gave_up, time.perf_counter() - started)
+
+
+def _claim_chunk(ids: List[int]) -> Tuple[Dict[int, Event], List[int], datetime.datetime]:
+    """claim_generation for a chunk: returns (claimed events, busy ids, claim time)."""
+    claimed_at = timezone.now()
+    events = {}
+    busy = []
+    with transaction.atomic():
+        for event in Event.objects.select_for_update().filter(id__in=ids):
+            if _generation_running(event):
+                busy.append(event.id)
+            else:
+                events[event.id] = event
+        Event.objects.filter(id__in=events).update(
+            generation_status=Event.GENERATION_RUNNING, generation_token="", generation_started_at=claimed_at
+        )
+    return events, busy, claimed_at
+
+
+def _generate_chunk(ids: List[int], executor: Optional[ProcessPoolExecutor], send_emails: bool) -> BatchResult:
+    events, busy, claimed_at = _claim_chunk(ids)
+    try:
+        return _solve_and_save_chunk(events, busy, claimed_at, executor, send_emails)
+    except Exception:
+        # let the next run or a generate click start over instead of waiting for the timeout
+        Event.objects.filter(
+            id__in=events, generation_status=Event.GENERATION_RUNNING, generation_started_at=claimed_at
+        ).update(generation_status=Event.GENERATION_IDLE)
+        raise
+
+
+def _solve_and_save_chunk(
+    events: Dict[int, Event],
+    busy: List[int],
+    claimed_at: datetime.datetime,
+    executor: Optional[ProcessPoolExecutor],
+    send_emails: bool,
+) -> BatchResult:
+    participants: Dict[int, List[Participant]] = defaultdict(list)
+    for p in Participant.objects.filter(event_id__in=events).order_by("event_id", "id"):
+        participants[p.event_id].append(p)
+
+    exclusions: Dict[int, List[Tuple[int, int, Optional[int]]]] = defaultdict(list)
+    for event_id, giver_id, excluded_id, penalty in Exclusion.objects.filter(event_id__in=events).values_list(
+        "event_id", "giver_id", "excluded_id", "penalty"
+    ):
+        exclusions[event_id].append((giver_id, excluded_id, penalty))
+
+    repeats = history.previous_pairs(
+        (event, participants[event_id])
+        for event_id, event in events.items()
+        if event.history_mode != Event.HISTORY_OFF
+    )
+
+    assignments: Dict[int, Optional[List[int]]] = {}
+    fingerprints: Dict[int, str] = {}
+    jobs = []
+    for event_id, event in events.items():
+        people = participants[event_id]
+        if len(people) < 4:
+            assignments[event_id] = None
+            continue
+
+        single_cycle = event.match_mode == Event.MODE_CYCLE
+        graph = with_history(event_graph(people, exclusions[event_id]), event.history_mode, repeats.get(event_id, []))
+        fp = fingerprints[event_id] = solver_cache.fingerprint(graph, single_cycle)
+        cached = solver_cache.lookup(fp)
+        if cached is not None and (not cached["feasible"] or cached["assignment"] is not None):
+            assignments[event_id] = cached["assignment"]
+            event.match_seed = cached["seed"]
+        else:
+            event.match_seed = new_seed()
+            jobs.append((event_id, graph, single_cycle, event.match_seed))
+
+    results = executor.map(_solve_job, jobs) if executor is not None else map(_solve_job, jobs)
+    gave_up = set()
+    for event_id, assignment, solver_gave_up in results:
+        assignments[event_id] = assignment
+        if solver_gave_up:
+            gave_up.add(event_id)
+        elif assignment is None:
+            solver_cache.store(fingerprints[event_id], None)
+
+    with transaction.atomic():
+        # same row locks as claim_generation, so a generate click waits for us;
+        # a claim that timed out meanwhile may have been taken over
+        ours = set(
+            Event.objects.select_for_update()
+            .filter(id__in=events, generation_status=Event.GENERATION_RUNNING, generation_started_at=claimed_at)
+            .values_list("id", flat=True)
+        )
+        busy = busy + [event_id for event_id in events if event_id not in ours]
+        generated = [event_id for event_id in events if event_id in ours and assignments[event_id] is not None]
+        infeasible = [
+            event_id for event_id in events
+            if event_id in ours and assignments[event_id] is None and event_id not in gave_up
+        ]
+        retry = [event_id for event_id in events if event_id in ours and event_id in gave_up]
+
+        match_rows = []
+        history_rows = []
+        email_rows = []
+        for event_id in generated:
+            people = participants[event_id]
+            solver_cache.consume(fingerprints[event_id])
+            matches = {people[g]: people[r] for g, r in enumerate(assignments[event_id])}
+            match_rows.extend(
+                Match(event_id=event_id, giver=giver, receiver=receiver) for giver, receiver in matches.items()
+            )
+            history_rows.extend(history.history_rows(events[event_id], matches))
+            if send_emails:
+                email_rows.extend(match_email_rows(events[event_id], matches))
+            events[event_id].generation_status = Event.GENERATION_DONE
+
+        Event.objects.bulk_update(
+            [events[event_id] for event_id in generated], ["match_seed", "generation_status"]
+        )
+        Event.objects.filter(id__in=infeasible).update(generation_status=Event.GENERATION_FAILED)
+        Event.objects.filter(id__in=retry).update(generation_status=Event.GENERATION_IDLE)
+        Match.objects.filter(event_id__in=generated).delete()
+        Match.objects.bulk_create(match_rows)
+        page_cache.invalidate(*generated, *infeasible)
+        PairingHistory.objects.filter(event_id__in=generated).delete()
+        PairingHistory.objects.bulk_create(history_rows)
+        if send_emails:
+            supersede_pending(event_id__in=generated)
+            OutboundEmail.objects.bulk_create(email_rows)
+
+    return BatchResult(generated, infeasible, busy, retry, 0.0)
@@ -0,0 +1,33 @@
+"""Keep santa.page_cache in step with the models (connected in SantaConfig.ready)."""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import page_cache
+from .models import Event, Exclusion, Match, Participant
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_changed(sender, instance, **kwargs):
+    page_cache.invalidate(instance.id)
+
+
+@receiver(post_delete, sender=Participant)
+@receiver(post_delete, sender=Exclusion)
+def event_row_deleted(sender, instance, origin=None, **kwargs):
+    # deleting the event itself already dropped its pages in event_changed
+    if not isinstance(origin, Event):
+        page_cache.invalidate(instance.event_id)
+
+
+# No post_delete for matches: with a receiver connected, Django loads and
+# signals every row of a queryset .delete() (a 5000-match event regenerating)
+# instead of issuing one DELETE. The code deleting them calls
+# page_cache.invalidate() instead. Participants are loaded anyway (their
+# matches cascade) and exclusions are only deleted one at a time or with their
+# event.
+@receiver(post_save, sender=Participant)
+@receiver(post_save, sender=Exclusion)
+@receiver(post_save, sender=Match)
+def event_row_changed(sender, instance, **kwargs):
+    page_cache.invalidate(instance.event_id)
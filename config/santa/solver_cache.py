@@ -0,0 +1,84 @@
+"""
+Cache of solver results keyed by the shape of the constraint graph.
+
+The restrictions step dry-runs the solver and the generate step later solves
+the exact same graph again, so both look here first. Entries live in the
+Django cache (LRU + TTL eviction, see CACHES in settings) under a hash of
+(participant count, match mode, excluded index pairs, penalties), which is the same for
+the dry run and for the saved event because participants keep their order.
+
+Entries and the hit/miss counters are as shared as the cache backend: with the
+default LocMemCache every worker process has its own, so a generation handled
+by another worker than the dry run solves again and stats() only counts the
+lookups of the process answering. Set CACHE_BACKEND to share them.
+"""
+import hashlib
+import json
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+if TYPE_CHECKING:
+    from .logic import ConstraintGraph
+
+KEY_PREFIX = "santa:solver:"
+HITS_KEY = KEY_PREFIX + "hits"
+MISSES_KEY = KEY_PREFIX + "misses"
+
+
+def fingerprint(graph: "ConstraintGraph", single_cycle: bool = False) -> str:
+    """Canonical hash of a constraint graph."""
+    payload = json.dumps(
+        [graph.n, "cycle" if single_cycle else "any", list(graph.pairs()), list(graph.soft_pairs())],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _count(key: str) -> None:
+    # add() is a no-op when the counter exists, incr() is atomic on real backends
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:  # evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+
+
+def lookup(fp: str) -> Optional[dict]:
+    """
+    Returns {"feasible": bool, "assignment": list or None, "seed": int or None}
+    or None on a miss. A feasible entry without an assignment means its witness
+    was already used. seed is what the assignment was solved with.
+    """
+    entry = cache.get(KEY_PREFIX + fp)
+    _count(HITS_KEY if entry is not None else MISSES_KEY)
+    return entry
+
+
+def store(fp: str, assignment: Optional[List[int]], seed: Optional[int] = None) -> None:
+    """
+    Remember the verdict for this graph, plus the solution (and its seed) if
+    there is one. assignment None means proved impossible and is served for
+    SANTA_SOLVER_CACHE_TIMEOUT: never store a solve that gave up (SolverGaveUp).
+    """
+    cache.set(
+        KEY_PREFIX + fp,
+        {"feasible": assignment is not None, "assignment": assignment, "seed": seed},
+        timeout=settings.SANTA_SOLVER_CACHE_TIMEOUT,
+    )
+
+
+def consume(fp: str) -> None:
+    """Keep the feasible verdict but drop the witness, so a re-generation draws fresh matches."""
+    cache.set(
+        KEY_PREFIX + fp,
+        {"feasible": True, "assignment": None, "seed": None},
+        timeout=settings.SANTA_SOLVER_CACHE_TIMEOUT,
+    )
+
+
+def stats() -> Dict[str, int]:
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    return {"hits": hits, "misses": misses, "lookups": hits + misses}
@@ -1,3 +1,1157 @@
-from django.test import TestCase
+import datetime
+import itertools
+import json
+import random
+import re
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import history, metrics, outbox, services, solver_cache
+from .benchmarks import Case, build_constraints, run_case
+from .logic import (
+    LARGE_EVENT_THRESHOLD,
+    OPTIMIZE_LIMIT,
+    ConstraintGraph,
+    SolveStats,
+    SolverGaveUp,
+    dry_run_matches_from_restrictions,
+    find_hall_violation,
+    generate_secret_santa_matches,
+    _solve_mode,
+)
+from .models import Event, EventDraft, Exclusion, Match, OutboundEmail, Participant
+from .outbox import deliver_pending, enqueue_match_emails
+from .services import create_event_with_participants, generate_matches_for_events, save_generated_matches
+
+
+def start_draft(client, owner, event_data, names):
+    # what create_event leaves behind for the restrictions step
+    draft = EventDraft.objects.create(
+        owner=owner, event_data=event_data, participants=[{"name": name, "email": f"{name}@example.com"} for name in names]
+    )
+    session = client.session
+    session["draft_id"] = draft.id
+    session.save()
+    return draft
+
+
+reported_stats = []
+
+
+def record_stats(stats):
+    # SANTA_SOLVE_HOOKS entry for SolveStatsTests
+    reported_stats.append(stats)
+
+
+def make_event(num_participants, organizer=None):
+    organizer = organizer or User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+    event = Event.objects.create(organizer=organizer, event_name="Office", event_date=datetime.date(2026, 12, 20))
+    Participant.objects.bulk_create([
+        Participant(event=event, name=f"P{i}", email=f"p{i}@example.com")
+        for i in range(num_participants)
+    ])
+    return event
+
+
+class ConstraintGraphTests(TestCase):
+    def test_self_is_implied_and_pairs_are_canonical(self):
+        graph = ConstraintGraph(4, {2: {2, 3, 0}, 0: {1}})
+        self.assertFalse(graph.is_allowed(1, 1))
+        self.assertFalse(graph.is_allowed(2, 3))
+        self.assertTrue(graph.is_allowed(3, 2))
+        self.assertEqual(graph.allowed(2), [1])
+        self.assertEqual(list(graph.pairs()), [(0, 1), (2, 0), (2, 3)])
+        self.assertEqual(graph.num_exclusions, 3)
+
+        graph.allow(0, 1)
+        graph.exclude(3, 3)
+        self.assertTrue(graph.is_allowed(0, 1))
+        self.assertEqual(list(graph.pairs()), [(2, 0), (2, 3)])
+
+
+class SoftConstraintTests(TestCase):
+    def test_min_cost_is_optimal(self):
+        rng = random.Random(7)
+        for _ in range(100):
+            n = rng.randint(3, 6)
+            graph = ConstraintGraph(n)
+            for g in range(n):
+                for r in range(n):
+                    roll = rng.random()
+                    if roll < 0.25:
+                        graph.exclude(g, r)
+                    elif roll < 0.6:
+                        graph.penalize(g, r, rng.randint(1, 4))
+
+            costs = [
+                sum(graph.penalty(g, p[g]) for g in range(n))
+                for p in itertools.permutations(range(n))
+                if all(graph.is_allowed(g, p[g]) for g in range(n))
+            ]
+            assignment = _solve_mode(graph, False, rng)
+            if not costs:
+                self.assertIsNone(assignment)
+                continue
+            self.assertEqual(sorted(assignment), list(range(n)))
+            self.assertEqual(sum(graph.penalty(g, r) for g, r in enumerate(assignment)), min(costs))
+
+    def test_avoidable_penalties_cost_nothing(self):
+        n = 30
+        graph = ConstraintGraph(n)
+        for g in range(n):
+            graph.penalize(g, (g + 1) % n, 5)
+            graph.penalize(g, (g + 2) % n, 5)
+        assignment = _solve_mode(graph, False, random.Random(1))
+        self.assertEqual(sum(graph.penalty(g, r) for g, r in enumerate(assignment)), 0)
+
+    def test_large_events_only_pay_unavoidable_penalties(self):
+        n = OPTIMIZE_LIMIT + 100
+        graph = ConstraintGraph(n)
+        # P0..P2 may only draw P3, P4 for free or each other at a price
+        for g in range(3):
+            for r in range(n):
+                if r >= 5:
+                    graph.exclude(g, r)
+                elif r < 3:
+                    graph.penalize(g, r, 1)
+        for g in range(n):
+            graph.penalize(g, (g + 7) % n, 5)
+        assignment = _solve_mode(graph, False, random.Random(2))
+        self.assertEqual(sorted(assignment), list(range(n)))
+        self.assertTrue(all(graph.is_allowed(g, r) for g, r in enumerate(assignment)))
+        self.assertEqual(sum(graph.penalty(g, r) for g, r in enumerate(assignment)), 1)
+
+    def test_soft_exclusions_instead_of_failing(self):
+        event = make_event(5)
+        people = list(event.participants.order_by("id"))
+        # P0..P2 can only draw P3 or P4 without a penalty, so one of them must pay
+        for giver in people[:3]:
+            for excluded in people[:3]:
+                if excluded != giver:
+                    Exclusion.objects.create(event=event, giver=giver, excluded=excluded, penalty=3 if excluded == people[2] else 1)
+
+        matches = generate_secret_santa_matches(event)
+        penalty = {(e.giver_id, e.excluded_id): e.penalty for e in event.exclusions.all()}
+        self.assertEqual(sum(penalty.get((g.id, r.id), 0) for g, r in matches.items()), 1)
+
+
+class DryRunTests(TestCase):
+    def test_every_giver_gets_one_allowed_receiver(self):
+        n = 8
+        restrictions = {g: {g, (g + 1) % n, (g + 2) % n} for g in range(n)}
+        assignment = dry_run_matches_from_restrictions(n, restrictions)
+
+        self.assertEqual(sorted(assignment), list(range(n)))
+        self.assertEqual(sorted(assignment.values()), list(range(n)))
+        for giver, receiver in assignment.items():
+            self.assertNotIn(receiver, restrictions[giver])
+
+    def test_hall_violation_is_detected(self):
+        # givers 0-3 can only draw 4 or 5: impossible no matter how many retries
+        n = 10
+        restrictions = {g: {g} for g in range(n)}
+        for g in range(4):
+            restrictions[g] |= set(range(n)) - {4, 5}
+        self.assertIsNone(dry_run_matches_from_restrictions(n, restrictions))
+
+    def test_large_event_mode(self):
+        n = LARGE_EVENT_THRESHOLD * 5
+        restrictions = {g: {(g + 1) % n, (g + 7) % n} for g in range(n)}
+        assignment = dry_run_matches_from_restrictions(n, restrictions)
+
+        self.assertEqual(sorted(assignment.values()), list(range(n)))
+        for giver, receiver in assignment.items():
+            self.assertNotEqual(giver, receiver)
+            self.assertNotIn(receiver, restrictions[giver])
+
+    def test_large_event_mode_detects_infeasible(self):
+        n = LARGE_EVENT_THRESHOLD * 5
+        restrictions = {g: set(range(n)) - {0, 1} for g in range(2, 5)}
+        self.assertIsNone(dry_run_matches_from_restrictions(n, restrictions))
+
+
+class HallViolationTests(TestCase):
+    def test_feasible_has_no_violation(self):
+        self.assertIsNone(find_hall_violation(6, {0: {0, 1}, 1: {1, 2}}))
+
+    def test_reports_only_the_offending_group(self):
+        n = 8
+        restrictions = {g: {g} for g in range(n)}
+        # 0, 1 and 2 may only draw 6 or 7; everybody else is unrestricted
+        for g in (0, 1, 2):
+            restrictions[g] = set(range(6))
+        violation = find_hall_violation(n, restrictions)
+        self.assertEqual(violation.givers, [0, 1, 2])
+        self.assertEqual(violation.receivers, [6, 7])
+
+    def test_restrictions_page_names_the_group(self):
+        organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+        self.client.force_login(organizer)
+        start_draft(self.client, organizer, {"event_name": "Family", "event_date": "2026-12-24"}, ["Ann", "Bo", "Cy", "Di", "Ed", "Flo"])
+
+        # Ann, Bo and Cy may only draw Di or Ed
+        response = self.client.post(reverse("event_restrictions"), {
+            "exclude_0": ["1", "2", "5"],
+            "exclude_1": ["0", "2", "5"],
+            "exclude_2": ["0", "1", "5"],
+        })
+        self.assertContains(response, "Ann, Bo and Cy can only draw Di and Ed between them")
+        self.assertContains(response, 'class="card conflict"', count=3)
+        self.assertEqual(len(re.findall(r"checked\s*/>", response.content.decode())), 9)
+        self.assertFalse(Event.objects.exists())
+
+    def test_restrictions_page_renders_unticked(self):
+        organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+        self.client.force_login(organizer)
+        draft = start_draft(self.client, organizer, {"event_name": "Family", "event_date": "2026-12-24"}, ["Ann", "Bo", "Cy", "Di"])
+
+        response = self.client.get(reverse("event_restrictions"))
+        self.assertContains(response, "Di")
+        self.assertEqual(len(re.findall(r"checked\s*/>", response.content.decode())), 0)
+        self.assertNotContains(response, 'class="card conflict"')
+        draft.refresh_from_db()
+        self.assertEqual(draft.matcher_state["n"], 4)
+
+
+class LiveCheckTests(TestCase):
+    def setUp(self):
+        organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+        self.client.force_login(organizer)
+        start_draft(self.client, organizer, {"event_name": "Family", "event_date": "2026-12-24"}, ["Ann", "Bo", "Cy", "Di", "Ed", "Flo"])
+        self.assertEqual(self.client.get(reverse("event_restrictions")).status_code, 200)
+
+    def toggle(self, giver, receiver, excluded=True):
+        return self.client.post(reverse("restrictions_check"), {
+            "giver": giver, "receiver": receiver, "excluded": "1" if excluded else "0",
+        }).json()
+
+    def test_ticking_and_unticking(self):
+        for giver, excluded in ((0, (1, 2, 5)), (1, (0, 2, 5))):
+            for receiver in excluded:
+                self.assertTrue(self.toggle(giver, receiver)["feasible"])
+
+        self.assertTrue(self.toggle(2, 0)["feasible"])
+        self.assertTrue(self.toggle(2, 1)["feasible"])
+        result = self.toggle(2, 5)
+        self.assertFalse(result["feasible"])
+        self.assertEqual(result["givers"], [0, 1, 2])
+        self.assertEqual(result["message"], "Ann, Bo and Cy can only draw Di and Ed between them.")
+
+        self.assertTrue(self.toggle(2, 5, excluded=False)["feasible"])
+
+    def test_cycle_drafts_are_told_the_circle_is_checked_later(self):
+        self.assertFalse(self.toggle(0, 1)["single_cycle"])
+        draft = EventDraft.objects.get()
+        draft.event_data = {**draft.event_data, "match_mode": Event.MODE_CYCLE}
+        draft.save()
+        self.assertTrue(self.toggle(0, 2)["single_cycle"])
+
+    def test_rejects_bad_input(self):
+        response = self.client.post(reverse("restrictions_check"), {"giver": "9", "receiver": "0", "excluded": "1"})
+        self.assertEqual(response.status_code, 400)
+
+
+def follow_circle(assignment):
+    """Number of people visited starting from 0 until we are back at 0."""
+    seen, current = 1, assignment[0]
+    while current != 0:
+        seen += 1
+        current = assignment[current]
+    return seen
+
+
+class SingleCycleTests(TestCase):
+    def test_unconstrained_is_one_circle(self):
+        assignment = dry_run_matches_from_restrictions(12, {}, single_cycle=True)
+        self.assertEqual(follow_circle(assignment), 12)
+
+    def test_constrained_circle_respects_exclusions(self):
+        n = 10
+        # everybody may only give to the next two people: forces a tight search
+        restrictions = {g: set(range(n)) - {(g + 1) % n, (g + 2) % n} for g in range(n)}
+        assignment = dry_run_matches_from_restrictions(n, restrictions, single_cycle=True)
+
+        self.assertEqual(follow_circle(assignment), n)
+        for giver, receiver in assignment.items():
+            self.assertNotIn(receiver, restrictions[giver])
+
+    def test_matching_possible_but_no_circle(self):
+        # two separate pairs swapping gifts is the only valid assignment
+        restrictions = {0: {0, 2, 3}, 1: {1, 2, 3}, 2: {0, 1, 2}, 3: {0, 1, 3}}
+        self.assertIsNotNone(dry_run_matches_from_restrictions(4, restrictions))
+        self.assertIsNone(dry_run_matches_from_restrictions(4, restrictions, single_cycle=True))
+
+    def test_large_constrained_circles(self):
+        n = LARGE_EVENT_THRESHOLD + 100
+        ring = {g: set(range(n)) - {(g + 1) % n, (g + 2) % n} for g in range(n)}
+        departments = {g: {r for r in range(n) if r % 2 == g % 2} for g in range(n)}
+        for restrictions in (ring, departments):
+            assignment = dry_run_matches_from_restrictions(n, restrictions, single_cycle=True)
+            self.assertEqual(follow_circle(assignment), n)
+            for giver, receiver in assignment.items():
+                self.assertNotIn(receiver, restrictions[giver])
+
+    def test_giving_up_is_not_a_verdict(self):
+        event = make_event(12)
+        event.match_mode = Event.MODE_CYCLE
+        event.save()
+        people = list(event.participants.order_by("id"))
+        Exclusion.objects.bulk_create([
+            Exclusion(event=event, giver=giver, excluded=other)
+            for i, giver in enumerate(people)
+            for j, other in enumerate(people)
+            if (j - i) % 12 not in (0, 1, 2)
+        ])
+        self.client.force_login(event.organizer)
+        url = reverse("generate_matches", args=[event.id])
+
+        with mock.patch("santa.logic._patch_cycles", return_value=False), mock.patch("santa.logic.CYCLE_SEARCH_BUDGET", 1):
+            with self.assertRaises(SolverGaveUp):
+                generate_secret_santa_matches(event)
+            response = self.client.post(url, follow=True)
+        self.assertContains(response, "find one circle through everyone this time")
+        self.assertNotContains(response, "Too many restrictions")
+        event.refresh_from_db()
+        self.assertEqual(event.generation_status, Event.GENERATION_IDLE)
+
+        self.client.post(url)
+        self.assertEqual(event.matches.count(), 12)
+
+    def test_event_in_cycle_mode(self):
+        event = make_event(7)
+        event.match_mode = Event.MODE_CYCLE
+        event.save()
+
+        matches = generate_secret_santa_matches(event)
+        by_index = {g.id: r.id for g, r in matches.items()}
+        ids = sorted(by_index)
+        self.assertEqual(follow_circle({ids.index(g): ids.index(r) for g, r in by_index.items()}), 7)
+
+
+class BenchmarkTests(TestCase):
+    def test_cases_have_expected_feasibility(self):
+        self.assertTrue(run_case(Case("random", 40, 0.3, 1), repeat=1)["feasible"])
+        self.assertTrue(run_case(Case("cycle", 40, 0.3, 1), repeat=1)["feasible"])
+
+        row = run_case(Case("hall", 40, 0.3, 1), repeat=1)
+        self.assertFalse(row["feasible"])
+        self.assertEqual(row["attempts"], 1)
+        self.assertGreater(row["peak_kib"], 0)
+
+    def test_hall_case_really_violates_halls_condition(self):
+        forbidden = build_constraints(Case("hall", 50, 0.0, 3))
+        squeezed = list(forbidden)
+        allowed = set().union(*(set(range(50)) - forbidden[g] for g in squeezed))
+        self.assertLess(len(allowed), len(squeezed))
+
+    def test_command_emits_json(self):
+        out = StringIO()
+        call_command("bench_solvers", sizes=[8], densities=[0.2], repeat=1, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual([row["case"] for row in report["results"]], ["random-n8-d0.2", "hall-n8-d0.2", "cycle-n8-d0.2", "soft-n8-d0.2"])
+
+
+class SolveStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reported_stats.clear()
+
+    def test_counters_and_phases(self):
+        n = 10
+        restrictions = {g: set(range(n)) - {(g + 1) % n, (g + 2) % n} for g in range(n)}
+        stats = SolveStats(n, "cycle")
+        assignment = _solve_mode(ConstraintGraph(n, restrictions), True, random.Random(4), stats)
+
+        self.assertIsNotNone(assignment)
+        self.assertGreater(stats.attempts, 1)
+        self.assertGreater(stats.nodes, 0)
+        self.assertIn("repair", stats.phases)
+        self.assertIn("search", stats.phases)
+
+        stats = SolveStats(4)
+        # 0 and 1 can only draw 2
+        self.assertIsNone(_solve_mode(ConstraintGraph(4, {0: {1, 3}, 1: {0, 3}}), False, random.Random(1), stats))
+        self.assertGreater(stats.backtracks, 0)
+
+    @override_settings(SANTA_SOLVE_HOOKS=["santa.tests.record_stats"])
+    def test_hooks_see_solves_and_cache_hits(self):
+        event = make_event(6)
+        generate_secret_santa_matches(event)
+        dry_run_matches_from_restrictions(5, {0: {1}})
+        dry_run_matches_from_restrictions(5, {0: {1}})
+
+        labels = [(stats.label, stats.feasible, stats.cached) for stats in reported_stats]
+        self.assertEqual(labels, [(f"event {event.id}", True, False), ("dry run", True, False), ("dry run", True, True)])
+        self.assertEqual(reported_stats[0].n, 6)
+        self.assertGreater(reported_stats[0].seconds, 0)
+
+    @override_settings(SANTA_SLOW_SOLVE_SECONDS=0)
+    def test_slow_solves_are_logged(self):
+        with self.assertLogs("santa.logic", "WARNING") as logs:
+            dry_run_matches_from_restrictions(6, {}, single_cycle=True)
+        self.assertIn("slow solve dry run: n=6 mode=cycle feasible=True", logs.output[0])
+
+
+class SolverCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fingerprint_ignores_order_and_self(self):
+        a = solver_cache.fingerprint(ConstraintGraph(5, {0: {0, 2, 3}, 1: {4}}))
+        b = solver_cache.fingerprint(ConstraintGraph(5, {1: {1, 4}, 0: {3, 2}}))
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, solver_cache.fingerprint(ConstraintGraph(5, {0: {2, 3}, 1: {4}}), single_cycle=True))
+        self.assertNotEqual(a, solver_cache.fingerprint(ConstraintGraph(6, {0: {2, 3}, 1: {4}})))
+
+    def test_resubmit_and_generation_reuse_dry_run(self):
+        event = make_event(6)
+        people = list(event.participants.order_by("id"))
+        Exclusion.objects.create(event=event, giver=people[0], excluded=people[1])
+
+        dry = dry_run_matches_from_restrictions(6, {g: {g} for g in range(6)} | {0: {0, 1}})
+        again = dry_run_matches_from_restrictions(6, {0: {0, 1}})
+        self.assertEqual(dry, again)
+
+        matches = generate_secret_santa_matches(event)
+        self.assertEqual({people.index(g): people.index(r) for g, r in matches.items()}, dry)
+        self.assertEqual(solver_cache.stats(), {"hits": 2, "misses": 1, "lookups": 3})
+
+    def test_infeasible_verdict_is_cached(self):
+        restrictions = {g: {0, 1, 2, 3} - {(g + 1) % 4} for g in range(4)} | {1: {0, 1, 2, 3}}
+        self.assertIsNone(dry_run_matches_from_restrictions(4, restrictions))
+        self.assertIsNone(dry_run_matches_from_restrictions(4, restrictions))
+        self.assertEqual(solver_cache.stats()["hits"], 1)
+
+    def test_giving_up_is_not_cached(self):
+        n = 12
+        ring = {g: set(range(n)) - {(g + 1) % n, (g + 2) % n} for g in range(n)}
+        event = make_event(n)
+        event.match_mode = Event.MODE_CYCLE
+        event.save()
+        people = list(event.participants.order_by("id"))
+        Exclusion.objects.bulk_create([
+            Exclusion(event=event, giver=people[g], excluded=people[r]) for g in ring for r in ring[g] if r != g
+        ])
+
+        with mock.patch("santa.logic._patch_cycles", return_value=False), mock.patch("santa.logic.CYCLE_SEARCH_BUDGET", 1):
+            with self.assertRaises(SolverGaveUp):
+                dry_run_matches_from_restrictions(n, ring, single_cycle=True)
+            with self.assertRaises(SolverGaveUp):
+                generate_secret_santa_matches(event)
+            result = generate_matches_for_events([event.id], workers=1)
+        self.assertEqual((result.infeasible, result.gave_up), ([], [event.id]))
+        self.assertEqual(solver_cache.stats()["hits"], 0)
+
+        self.assertEqual(follow_circle(dry_run_matches_from_restrictions(n, ring, single_cycle=True)), n)
+        self.assertEqual(generate_matches_for_events([event.id], workers=1).generated, [event.id])
+
+    def test_stats_endpoint_is_staff_only(self):
+        url = reverse("solver_cache_stats")
+        user = User.objects.create_user(username="staff", password="pw", is_staff=True)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(user)
+        stats = self.client.get(url).json()
+        self.assertEqual(stats["lookups"], 0)
+        self.assertFalse(stats["shared"])  # LocMemCache
+
+
+class GenerateMatchesTests(TestCase):
+    def test_respects_exclusions(self):
+        event = make_event(6)
+        people = list(event.participants.order_by("id"))
+        for giver in people[:3]:
+            for excluded in people[3:5]:
+                Exclusion.objects.create(event=event, giver=giver, excluded=excluded)
+
+        matches = generate_secret_santa_matches(event)
+
+        self.assertEqual(len(matches), 6)
+        self.assertEqual(len(set(matches.values())), 6)
+        for giver, receiver in matches.items():
+            self.assertNotEqual(giver, receiver)
+            self.assertFalse(Exclusion.objects.filter(giver=giver, excluded=receiver).exists())
+
+    def test_too_few_participants(self):
+        self.assertIsNone(generate_secret_santa_matches(make_event(3)))
+
+
+class SeedReplayTests(TestCase):
+    def test_same_seed_same_matches(self):
+        for single_cycle in (False, True):
+            for n in (12, LARGE_EVENT_THRESHOLD + 10):
+                restrictions = {g: {(g + 1) % n, (g + 3) % n} for g in range(n)}
+                first = dry_run_matches_from_restrictions(n, restrictions, single_cycle=single_cycle, seed=42)
+                again = dry_run_matches_from_restrictions(n, dict(reversed(restrictions.items())), single_cycle=single_cycle, seed=42)
+                self.assertEqual(first, again)
+
+    def test_generate_records_seed_and_replay_matches(self):
+        organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+        event = make_event(8, organizer)
+        self.client.force_login(organizer)
+        self.client.post(reverse("generate_matches", args=[event.id]))
+        event.refresh_from_db()
+        self.assertIsNotNone(event.match_seed)
+
+        out = StringIO()
+        call_command("replay_matches", event.id, stdout=out)
+        self.assertIn("identical", out.getvalue())
+
+        saved = set(event.matches.values_list("giver_id", "receiver_id"))
+        event.matches.all().delete()
+        call_command("replay_matches", event.id, stdout=StringIO())
+        self.assertEqual(set(event.matches.values_list("giver_id", "receiver_id")), saved)
+
+    def test_dry_run_witness_keeps_its_seed(self):
+        event = make_event(8)
+        people = list(event.participants.order_by("id"))
+        Exclusion.objects.create(event=event, giver=people[0], excluded=people[1])
+
+        witness = dry_run_matches_from_restrictions(8, {0: {0, 1}})
+        matches = generate_secret_santa_matches(event)
+        self.assertEqual({people.index(g): people.index(r) for g, r in matches.items()}, witness)
+
+        replayed = generate_secret_santa_matches(event, seed=event.match_seed)
+        self.assertEqual(replayed, matches)
+
+
+class PairingHistoryTests(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+        self.last_year = make_event(4, self.organizer)
+        Event.objects.filter(id=self.last_year.id).update(event_date=datetime.date(2025, 12, 20))
+        self.last_year.refresh_from_db()
+        old = list(self.last_year.participants.order_by("id"))
+        # P0 -> P1 -> P2 -> P3 -> P0
+        history.record_pairings(self.last_year, {old[i]: old[(i + 1) % 4] for i in range(4)})
+
+    def this_year(self, history_mode, only_last_years_pairs=False):
+        event = make_event(4, self.organizer)
+        Event.objects.filter(id=event.id).update(history_mode=history_mode)
+        event.refresh_from_db()
+        people = list(event.participants.order_by("id"))
+        for i, giver in enumerate(people):
+            Participant.objects.filter(id=giver.id).update(email=giver.email.upper())
+            if only_last_years_pairs:
+                for excluded in people:
+                    if excluded not in (giver, people[(i + 1) % 4]):
+                        Exclusion.objects.create(event=event, giver=giver, excluded=excluded)
+        return event
+
+    def test_hard_mode_never_repeats(self):
+        for _ in range(10):
+            event = self.this_year(Event.HISTORY_HARD)
+            matches = generate_secret_santa_matches(event)
+            pairs = {(g.name, r.name) for g, r in matches.items()}
+            self.assertFalse(pairs & {("P0", "P1"), ("P1", "P2"), ("P2", "P3"), ("P3", "P0")})
+
+    def test_soft_mode_falls_back_to_repeats(self):
+        self.assertIsNone(generate_secret_santa_matches(self.this_year(Event.HISTORY_HARD, only_last_years_pairs=True)))
+
+        matches = generate_secret_santa_matches(self.this_year(Event.HISTORY_SOFT, only_last_years_pairs=True))
+        self.assertEqual({(g.name, r.name) for g, r in matches.items()}, {("P0", "P1"), ("P1", "P2"), ("P2", "P3"), ("P3", "P0")})
+
+    def test_lookup_is_one_query_and_respects_dates(self):
+        events = [self.this_year(Event.HISTORY_HARD) for _ in range(3)]
+        Event.objects.filter(id=events[2].id).update(event_date=datetime.date(2025, 1, 1))
+        events[2].refresh_from_db()
+
+        with_people = [(e, list(e.participants.order_by("id"))) for e in events]
+        with self.assertNumQueries(1):
+            repeats = history.previous_pairs(with_people)
+
+        self.assertEqual(repeats[events[0].id], [(0, 1), (1, 2), (2, 3), (3, 0)])
+        self.assertEqual(repeats[events[2].id], [])
+
+    def test_generate_view_records_history(self):
+        event = make_event(5, self.organizer)
+        self.client.force_login(self.organizer)
+        self.client.post(reverse("generate_matches", args=[event.id]))
+        self.client.post(reverse("generate_matches", args=[event.id]))
+
+        saved = set(event.matches.values_list("giver__email", "receiver__email"))
+        self.assertEqual(set(event.pairing_history.values_list("giver_email", "receiver_email")), saved)
+
+
+class GenerationIdempotencyTests(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+        self.event = make_event(6, self.organizer)
+        self.client.force_login(self.organizer)
+        self.url = reverse("generate_matches", args=[self.event.id])
+
+    def test_same_token_is_answered_without_solving_again(self):
+        self.client.post(self.url, {"generation_token": "abc"})
+        first = set(Match.objects.values_list("id", flat=True))
+
+        with mock.patch("santa.views.generate_secret_santa_matches") as solve:
+            response = self.client.post(self.url, {"generation_token": "abc"}, follow=True)
+        solve.assert_not_called()
+        self.assertContains(response, "already generated")
+        self.assertEqual(set(Match.objects.values_list("id", flat=True)), first)
+        self.assertEqual(OutboundEmail.objects.count(), 6)
+
+        self.client.post(self.url, {"generation_token": "def"})
+        self.assertNotEqual(set(Match.objects.values_list("id", flat=True)), first)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.generation_status, Event.GENERATION_DONE)
+
+    def test_running_generation_blocks_until_stale(self):
+        Event.objects.filter(id=self.event.id).update(
+            generation_status=Event.GENERATION_RUNNING, generation_started_at=timezone.now()
+        )
+        response = self.client.post(self.url, {"generation_token": "x"}, follow=True)
+        self.assertContains(response, "being generated right now")
+        self.assertFalse(Match.objects.exists())
+
+        Event.objects.filter(id=self.event.id).update(
+            generation_started_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        self.client.post(self.url, {"generation_token": "x"})
+        self.assertEqual(Match.objects.count(), 6)
+
+    def test_failed_save_does_not_leave_it_running(self):
+        with mock.patch("santa.views.save_generated_matches", side_effect=DatabaseError("gone")):
+            with self.assertRaises(DatabaseError):
+                self.client.post(self.url, {"generation_token": "x"})
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.generation_status, Event.GENERATION_IDLE)
+
+        self.client.post(self.url, {"generation_token": "x"})
+        self.assertEqual(Match.objects.count(), 6)
+
+    def test_batch_leaves_a_running_generation_alone(self):
+        Event.objects.filter(id=self.event.id).update(
+            generation_status=Event.GENERATION_RUNNING, generation_started_at=timezone.now()
+        )
+        result = generate_matches_for_events([self.event.id], workers=1)
+        self.assertEqual((result.generated, result.busy), ([], [self.event.id]))
+        self.assertFalse(Match.objects.exists())
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_generate_click_waits_for_a_batch(self):
+        solve = services._solve_job
+
+        def click_while_solving(job):
+            response = self.client.post(self.url, {"generation_token": "x"}, follow=True)
+            self.assertContains(response, "being generated right now")
+            return solve(job)
+
+        with mock.patch("santa.services._solve_job", click_while_solving):
+            result = generate_matches_for_events([self.event.id], workers=1)
+        self.assertEqual(result.generated, [self.event.id])
+        self.assertEqual(OutboundEmail.objects.count(), 6)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.generation_status, Event.GENERATION_DONE)
+
+    def test_event_page_renders_a_token(self):
+        response = self.client.get(reverse("event_details", args=[self.event.id]))
+        self.assertRegex(response.content.decode(), r'name="generation_token" value="[0-9a-f]{32}"')
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.event = make_event(5)
+        self.client.force_login(self.event.organizer)
+
+    def generate(self):
+        return self.client.post(reverse("generate_matches", args=[self.event.id]))
+
+    def test_generation_queues_instead_of_sending(self):
+        self.generate()
+
+        self.assertEqual(Match.objects.filter(event=self.event).count(), 5)
+        self.assertEqual(OutboundEmail.objects.filter(event=self.event, status=OutboundEmail.STATUS_PENDING).count(), 5)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_worker_sends_batch_over_one_connection(self):
+        self.generate()
+
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.open") as opened:
+            self.assertEqual(deliver_pending(), (5, 0))
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.STATUS_SENT).exists())
+        self.assertEqual(deliver_pending(), (0, 0))
+
+    def test_failed_send_is_retried_with_backoff(self):
+        self.generate()
+
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("timeout")):
+            self.assertEqual(deliver_pending(), (0, 5))
+
+        row = OutboundEmail.objects.filter(event=self.event).first()
+        self.assertEqual((row.status, row.attempts, row.last_error), (OutboundEmail.STATUS_PENDING, 1, "timeout"))
+        self.assertGreater(row.next_attempt_at, row.created_at + datetime.timedelta(seconds=30))
+        self.assertEqual(deliver_pending(), (0, 0))  # not due yet
+
+        response = self.client.get(reverse("event_details", args=[self.event.id]))
+        self.assertContains(response, "retrying")
+
+    def test_concurrent_sending_records_each_row(self):
+        self.generate()
+
+        async def send(batch, from_email, concurrency):
+            self.assertEqual(concurrency, 3)
+            return [OSError("refused") if i == 0 else None for i in range(len(batch))]
+
+        with self.settings(SANTA_SMTP_CONCURRENCY=3), mock.patch("santa.outbox._send_concurrently", send):
+            self.assertEqual(deliver_pending(), (4, 1))
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.STATUS_SENT).count(), 4)
+        self.assertEqual(OutboundEmail.objects.get(status=OutboundEmail.STATUS_PENDING).last_error, "refused")
+
+    def test_regenerating_supersedes_a_claimed_batch(self):
+        self.generate()
+        claim = outbox._claim_batch
+
+        def claim_then_regenerate(batch_size):
+            batch = claim(batch_size)
+            save_generated_matches(self.event, generate_secret_santa_matches(self.event))
+            return batch
+
+        with mock.patch("santa.outbox._claim_batch", claim_then_regenerate):
+            self.assertEqual(deliver_pending(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.STATUS_SUPERSEDED).count(), 5)
+
+        self.assertEqual(deliver_pending(), (5, 0))
+        response = self.client.get(reverse("event_details", args=[self.event.id]))
+        self.assertNotContains(response, "Superseded")
+
+        gone = OutboundEmail.objects.filter(status=OutboundEmail.STATUS_SENT).first()
+        OutboundEmail.objects.filter(id=gone.id).delete()
+        outbox._mark_sent(gone)  # no row to update, no error
+
+    def test_worker_loop_survives_a_failed_batch(self):
+        with mock.patch("santa.management.commands.send_outbox.deliver_pending", side_effect=[DatabaseError("gone"), (1, 0), (0, 0)]), \
+                mock.patch("santa.management.commands.send_outbox.time.sleep", side_effect=[None, KeyboardInterrupt]):
+            err, out = StringIO(), StringIO()
+            with self.assertRaises(KeyboardInterrupt):
+                call_command("send_outbox", "--loop", stdout=out, stderr=err)
+        self.assertIn("gone", err.getvalue())
+        self.assertIn("sent 1, failed 0", out.getvalue())
+
+
+class CreateEventServiceTests(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+        self.event_data = {"event_name": "Family", "event_date": "2026-12-24", "event_time": "", "match_mode": Event.MODE_ANY}
+
+    def test_query_count_does_not_grow_with_event_size(self):
+        for n in (5, 60):
+            participants = [{"name": f"P{i}", "email": f"p{i}@example.com"} for i in range(n)]
+            restrictions = {g: {g, (g + 1) % n, (g + 2) % n} for g in range(n)}
+
+            # savepoint + event + participants + exclusions + release
+            with self.assertNumQueries(5):
+                event = create_event_with_participants(self.organizer, self.event_data, participants, restrictions)
+
+            self.assertEqual(event.participants.count(), n)
+            self.assertEqual(event.exclusions.count(), 2 * n)
+
+    def test_exclusions_point_at_the_right_people(self):
+        participants = [{"name": name, "email": f"{name}@example.com"} for name in "abcde"]
+        event = create_event_with_participants(self.organizer, self.event_data, participants, {0: {0, 3}, 2: {2, 4}})
+
+        pairs = set(event.exclusions.values_list("giver__name", "excluded__name"))
+        self.assertEqual(pairs, {("a", "d"), ("c", "e")})
+
+    def test_wizard_creates_event(self):
+        self.client.force_login(self.organizer)
+        draft = start_draft(self.client, self.organizer, self.event_data, "abcde")
+
+        response = self.client.post(reverse("event_restrictions"), {"exclude_0": ["1", "x"], "exclude_3": ["4"]})
+
+        event = Event.objects.get()
+        self.assertRedirects(response, reverse("event_details", args=[event.id]))
+        self.assertEqual(set(event.exclusions.values_list("giver__name", "excluded__name")), {("a", "b"), ("d", "e")})
+        self.assertNotIn("draft_id", self.client.session)
+        self.assertFalse(EventDraft.objects.filter(id=draft.id).exists())
+
+    def test_wizard_keeps_state_out_of_the_session(self):
+        self.client.force_login(self.organizer)
+        form = {"event_name": "Family", "event_date": "2026-12-24", "match_mode": "any"}
+        for i, name in enumerate("abcde", start=1):
+            form[f"p{i}"] = name
+            form[f"p{i}_email"] = f"{name}@example.com"
+        self.assertRedirects(self.client.post(reverse("create_event"), form), reverse("event_restrictions"))
+
+        session = self.client.session
+        self.assertEqual(set(session.keys()) - {"_auth_user_id", "_auth_user_backend", "_auth_user_hash"}, {"draft_id"})
+        draft = EventDraft.objects.get(id=session["draft_id"])
+        self.assertEqual([p["name"] for p in draft.participants], list("abcde"))
+
+        self.client.get(reverse("event_restrictions"))
+        self.client.post(reverse("restrictions_check"), {"giver": 0, "receiver": 1, "excluded": "1"})
+        draft.refresh_from_db()
+        self.assertEqual(draft.matcher_state["forbidden"], {"0": [1]})
+
+    def test_someone_elses_draft_is_ignored(self):
+        other = User.objects.create_user(username="x@example.com", email="x@example.com", password="pw")
+        draft = EventDraft.objects.create(owner=other, event_data=self.event_data, participants=[{"name": "a", "email": "a@example.com"}] * 4)
+        self.client.force_login(self.organizer)
+        session = self.client.session
+        session["draft_id"] = draft.id
+        session.save()
+        self.assertRedirects(self.client.get(reverse("event_restrictions")), reverse("create_event"))
+
+    def test_purge_drafts(self):
+        fresh = EventDraft.objects.create(owner=self.organizer)
+        stale = EventDraft.objects.create(owner=self.organizer)
+        EventDraft.objects.filter(id=stale.id).update(updated_at=timezone.now() - datetime.timedelta(days=30))
+
+        call_command("purge_drafts", stdout=StringIO())
+        self.assertEqual(list(EventDraft.objects.values_list("id", flat=True)), [fresh.id])
+
+
+class ImportEventTests(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+        self.client.force_login(self.organizer)
+        self.form = {"event_name": "Company", "event_date": "2026-12-18", "match_mode": "any", "history_mode": "off"}
+
+    def upload(self, name, content):
+        return self.client.post(reverse("import_event"), {**self.form, "roster": SimpleUploadedFile(name, content.encode())})
+
+    def test_csv_with_forward_exclusions(self):
+        rows = ["name,email,excludes", "Ann,ann@example.com,Bo; cy@example.com"]
+        rows += [f"P{i},p{i}@example.com," for i in range(40)]
+        rows += ["Bo,bo@example.com,Ann", "Cy,cy@example.com,"]
+        with self.settings(SANTA_IMPORT_BATCH_SIZE=10, FILE_UPLOAD_MAX_MEMORY_SIZE=100):
+            response = self.upload("roster.csv", "\n".join(rows) + "\n")
+
+        event = Event.objects.get()
+        self.assertRedirects(response, reverse("event_details", args=[event.id]))
+        self.assertEqual(event.participants.count(), 43)
+        self.assertEqual(
+            set(event.exclusions.values_list("giver__name", "excluded__name")),
+            {("Ann", "Bo"), ("Ann", "Cy"), ("Bo", "Ann")},
+        )
+
+    def test_jsonl(self):
+        lines = [json.dumps({"name": f"P{i}", "email": f"p{i}@example.com", "excludes": [f"P{(i + 1) % 5}"]}) for i in range(5)]
+        self.upload("roster.jsonl", "\n".join(lines))
+        self.assertEqual(Event.objects.get().exclusions.count(), 5)
+
+    def test_reports_problems_with_line_numbers(self):
+        rows = [
+            "name,email,excludes",
+            "Ann,ann@example.com,Zed",
+            "ann,other@example.com,",
+            "Bo,ANN@example.com,",
+            "Cy,not-an-email,",
+            "Di,,",
+            f"{'E' * 51},e@example.com,",
+            f"Fay,{'f' * 250}@example.com,",
+        ]
+        response = self.upload("roster.csv", "\n".join(rows))
+
+        for message in (
+            "Line 3: the name ann is used twice.",
+            "Line 4: the email ANN@example.com is used twice.",
+            "Line 5: not-an-email is not a valid email.",
+            "Line 6: please give both a name and an email.",
+            "Line 7: names can be at most 50 characters.",
+            "Line 8: emails can be at most 254 characters.",
+            "Line 2: Zed in excludes is not on the list.",
+        ):
+            self.assertContains(response, message)
+        self.assertFalse(Event.objects.exists())
+
+    def test_checks_the_event_fields_too(self):
+        self.form.update(event_name="", event_date="2026-02-30", event_time="25:00")
+        rows = ["name,email"] + [f"P{i},p{i}@example.com" for i in range(5)]
+        response = self.upload("roster.csv", "\n".join(rows))
+        for message in ("Please give the event a name.", "Please give a valid event date.", "Please give a valid event time."):
+            self.assertContains(response, message)
+
+        self.form.update(event_name="Company", event_date="", event_time="")
+        self.assertContains(self.upload("roster.csv", "\n".join(rows)), "Please give a valid event date.")
+        self.assertFalse(Event.objects.exists())
+
+    def test_infeasible_roster_names_the_group(self):
+        # P0, P1 and P2 may only draw P3
+        rows = ["name,email,excludes"]
+        rows += [f"P{i},p{i}@example.com,P{(i + 1) % 3};P{(i + 2) % 3};P4" for i in range(3)]
+        rows += ["P3,p3@example.com,", "P4,p4@example.com,"]
+        response = self.upload("roster.csv", "\n".join(rows))
+        self.assertContains(response, "P0 and P1 can only draw P3 between them")
+        self.assertFalse(Event.objects.exists())
+
+
+class BatchGenerateTests(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+
+    def assert_valid_matches(self, event):
+        matches = list(event.matches.all())
+        self.assertEqual(len(matches), event.participants.count())
+        self.assertEqual(len({m.receiver_id for m in matches}), len(matches))
+        for m in matches:
+            self.assertNotEqual(m.giver_id, m.receiver_id)
+            self.assertFalse(event.exclusions.filter(giver=m.giver_id, excluded=m.receiver_id).exists())
+
+    def test_query_count_does_not_grow_with_events(self):
+        for count in (2, 8):
+            events = [make_event(6, self.organizer) for _ in range(count)]
+            for event in events:
+                people = list(event.participants.order_by("id"))
+                Exclusion.objects.create(event=event, giver=people[0], excluded=people[1])
+
+            # claim (savepoint + locked events + status + release), participants + exclusions
+            # (no history lookup with history off), then savepoint + row locks + seeds +
+            # matches, history and emails (delete + insert each) + release
+            with self.assertNumQueries(16):
+                result = generate_matches_for_events([e.id for e in events], workers=1)
+
+            self.assertEqual(sorted(result.generated), sorted(e.id for e in events))
+            for event in events:
+                self.assert_valid_matches(event)
+                self.assertEqual(event.outbound_emails.count(), 6)
+
+    def test_process_pool_and_infeasible_events(self):
+        good = [make_event(8, self.organizer) for _ in range(3)]
+        tiny = make_event(3, self.organizer)
+
+        result = generate_matches_for_events([e.id for e in good] + [tiny.id, 999_999], workers=2, chunk_size=2)
+
+        self.assertEqual(sorted(result.generated), sorted(e.id for e in good))
+        self.assertEqual(result.infeasible, [tiny.id])
+        for event in good:
+            self.assert_valid_matches(event)
+        self.assertFalse(tiny.matches.exists())
+
+    def test_command_reports_throughput(self):
+        event = make_event(5, self.organizer)
+        out = StringIO()
+        call_command("generate_matches", event.id, "--workers", "1", "--no-email", stdout=out)
+
+        self.assertIn("generated 1 events, 0 infeasible", out.getvalue())
+        self.assertIn("events/sec", out.getvalue())
+        self.assertEqual(event.matches.count(), 5)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+
+class QueryBudgetTests(TestCase):
+    """Page query counts must not depend on how many participants/events there are."""
+
+    def make_generated_event(self, num_participants, organizer):
+        event = make_event(num_participants, organizer)
+        people = list(event.participants.order_by("id"))
+        Match.objects.bulk_create([
+            Match(event=event, giver=giver, receiver=people[(i + 1) % len(people)])
+            for i, giver in enumerate(people)
+        ])
+        return event
+
+    def setUp(self):
+        self.organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+        self.guest = User.objects.create_user(username="p0@example.com", email="p0@example.com", password="pw")
+
+    def test_event_page_as_organizer(self):
+        for n in (5, 40):
+            event = self.make_generated_event(n, self.organizer)
+            self.client.force_login(self.organizer)
+            # session, user, event+organizer, participants, matches, emails
+            with self.assertNumQueries(6):
+                response = self.client.get(reverse("event_details", args=[event.id]))
+            self.assertEqual(len(response.context["all_matches"]), n)
+
+    def test_event_page_caps_the_match_list(self):
+        event = self.make_generated_event(12, self.organizer)
+        self.client.force_login(self.organizer)
+        with self.settings(SANTA_MATCHES_ON_PAGE=10):
+            response = self.client.get(reverse("event_details", args=[event.id]))
+        self.assertEqual(len(response.context["all_matches"]), 10)
+        self.assertContains(response, "download the file for the full list")
+
+    async def read_export(self, url, **params):
+        response = await self.async_client.get(url, params)
+        if not response.streaming:
+            return response
+        return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_export_streams_all_matches(self):
+        event = await sync_to_async(self.make_generated_event)(30, self.organizer)
+        await self.async_client.aforce_login(self.organizer)
+        url = reverse("export_matches", args=[event.id])
+
+        with self.settings(SANTA_EXPORT_CHUNK_SIZE=7):
+            lines = (await self.read_export(url)).splitlines()
+        self.assertEqual(lines[0], "giver_name,giver_email,receiver_name,receiver_email")
+        self.assertEqual(len(lines), 31)
+        self.assertIn("P0,p0@example.com,P1,p1@example.com", lines)
+
+        rows = json.loads(await self.read_export(url, format="json"))
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(rows[0]["giver_name"], "P0")
+
+        await self.async_client.aforce_login(self.guest)
+        self.assertRedirects(
+            await self.read_export(url), reverse("event_details", args=[event.id]), fetch_redirect_response=False
+        )
+
+    def test_event_page_as_participant(self):
+        for n in (5, 40):
+            event = self.make_generated_event(n, self.organizer)
+            self.client.force_login(self.guest)
+            # session, user, event+organizer, participants, my match
+            with self.assertNumQueries(5):
+                response = self.client.get(reverse("event_details", args=[event.id]))
+            self.assertEqual(response.context["my_match"].receiver.name, "P1")
+
+    @override_settings(SANTA_EVENT_PAGE_CACHE=True)
+    def test_event_page_is_served_from_cache(self):
+        event = make_event(6, self.organizer)
+        url = reverse("event_details", args=[event.id])
+        self.client.force_login(self.guest)
+        self.assertContains(self.client.get(url), "isn’t generated yet")
+
+        save_generated_matches(event, generate_secret_santa_matches(event))
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, "You are getting a gift for:")
+        # session, user
+        with self.assertNumQueries(2):
+            self.assertContains(self.client.get(url), "You are getting a gift for:")
+
+        self.client.force_login(self.organizer)
+        self.client.get(url)
+        # session, user, emails (delivery status is always live)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertContains(response, "Matches have been generated.")
+        self.assertContains(response, "P0 →")
+
+        renamed = event.participants.get(name="P5")
+        renamed.name = "Zed"
+        renamed.save()
+        self.assertContains(self.client.get(url), "Zed (p5@example.com)")
+
+        renamed.delete()  # e.g. from the admin
+        self.assertNotContains(self.client.get(url), "Zed (p5@example.com)")
+
+    def test_event_page_is_not_cached_on_a_process_local_cache(self):
+        # settings default with LocMemCache: another worker could not drop it
+        event = self.make_generated_event(5, self.organizer)
+        self.client.force_login(self.guest)
+        url = reverse("event_details", args=[event.id])
+        self.client.get(url)
+        # session, user, event+organizer, participants, my match
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+    def test_events_list(self):
+        self.client.force_login(self.guest)
+        for _ in range(2):
+            other = User.objects.create_user(username=f"o{Event.objects.count()}", password="pw")
+            make_event(4, other)
+            # session, user, page keys (UNION), events with organizers
+            with self.assertNumQueries(4):
+                self.client.get(reverse("events"))
+
+    def test_events_list_pages_by_date(self):
+        other = User.objects.create_user(username="other@example.com", password="pw")
+        expected = []
+        for organizer, day, invited in [
+            (self.organizer, 20, False), (self.organizer, 21, True), (self.organizer, 21, False),
+            (other, 21, True), (other, 22, True), (other, 23, False),
+        ]:
+            event = Event.objects.create(organizer=organizer, event_name="Office", event_date=datetime.date(2026, 12, day))
+            if invited:
+                Participant.objects.create(event=event, name="Org", email="org@example.com")
+            if organizer == self.organizer or invited:
+                expected.append((event.event_date, event.id))
+        expected = [event_id for _, event_id in sorted(expected, reverse=True)]
+
+        self.client.force_login(self.organizer)
+        seen = []
+        url = reverse("events")
+        with self.settings(SANTA_EVENTS_PER_PAGE=2):
+            while url:
+                response = self.client.get(url)
+                seen.extend(event.id for event in response.context["events"])
+                cursor = response.context["next_cursor"]
+                url = f"{reverse('events')}?after={cursor}" if cursor else None
+        self.assertEqual(seen, expected)
+        self.assertContains(response, "Newest")
+
+
+@override_settings(SANTA_METRICS_ENABLED=True, SANTA_METRICS_TOKEN="scrape")
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        self.organizer = User.objects.create_user(username="org@example.com", email="org@example.com", password="pw")
+
+    def test_requests_are_timed(self):
+        event = make_event(6, self.organizer)
+        self.client.force_login(self.organizer)
+        response = self.client.post(reverse("generate_matches", args=[event.id]), {"generation_token": "t1"})
+        self.assertRegex(response["Server-Timing"], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ calls", solver;dur=[\d.]+;desc="1 calls"$')
+
+        text = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape").content.decode()
+        self.assertIn('santa_requests_total{view="generate_matches",method="POST"} 1', text)
+        self.assertIn('santa_request_seconds_count{view="generate_matches"} 1', text)
+        self.assertIn('santa_solver_total{view="generate_matches"} 1', text)
+        self.assertRegex(text, r'santa_db_total\{view="generate_matches"\} [1-9]')
+
+    async def test_async_views_are_timed(self):
+        event = await sync_to_async(make_event)(5, self.organizer)
+        await self.async_client.aforce_login(self.organizer)
+        response = await self.async_client.get(reverse("event_details", args=[event.id]))
+        self.assertContains(response, "Generate Matches")
+        # session, user, event, participants, matches, emails
+        self.assertIn('db;dur=', response["Server-Timing"])
+        self.assertIn('desc="6 calls"', response["Server-Timing"])
+
+    def test_smtp_time_outside_requests(self):
+        event = make_event(4, self.organizer)
+        people = list(event.participants.order_by("id"))
+        enqueue_match_emails(event, {giver: people[(i + 1) % 4] for i, giver in enumerate(people)})
+        deliver_pending()
+        self.assertIn('santa_smtp_total{view=""} 4', metrics.registry.render())
+
+    def test_endpoint_needs_token_or_staff(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.organizer.is_staff = True
+        self.organizer.save()
+        self.client.force_login(self.organizer)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        with self.settings(SANTA_METRICS_ENABLED=False):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(SANTA_METRICS_ENABLED=False)
+    def test_disabled_middleware_is_skipped(self):
+        response = self.client.get(reverse("login"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(metrics.registry.requests, {})
+
+
+class HotPathIndexTests(TestCase):
+    def test_login_email_is_case_insensitive(self):
+        User.objects.create_user(username="ann@example.com", email="ann@example.com", password="pw")
+        response = self.client.post(reverse("login"), {"email": "Ann@Example.com", "password": "pw"})
+        self.assertRedirects(response, reverse("home"))
+
+    def test_explain_command_uses_indexes_and_rolls_back(self):
+        out = StringIO()
+        call_command("explain_hot_paths", participants=200, per_event=10, users=20, stdout=out)
+
+        after, before = out.getvalue().split("== before (no indexes) ==")
+        self.assertIn("participant_event_email_idx", after)
+        self.assertNotIn("participant_event_email_idx", before)
+        self.assertFalse(Participant.objects.exists())
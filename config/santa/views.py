@@ -1,24 +1,46 @@
-from django.shortcuts import render, get_object_or_404
+import csv
+import datetime
+import hmac
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+from django.shortcuts import aget_object_or_404, render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from .models import Event, Participant, Exclusion, Match
-from django.db.models import Q
-from django.db import transaction
-from .logic import generate_secret_santa_matches, dry_run_matches_from_restrictions
-from django.core.mail import send_mail
+from .models import Event, EventDraft, Participant, Match, OutboundEmail
+from django.db import connection, transaction
+from django.db.models import F, Q
+from .logic import (
+    IncrementalMatcher,
+    SolverGaveUp,
+    generate_secret_santa_matches,
+    dry_run_matches_from_restrictions,
+    find_hall_violation,
+)
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from . import metrics, page_cache, solver_cache
+from .importer import parse_roster
+from .services import claim_generation, create_event_with_participants, save_generated_matches
 
 def login_view(request):
     if request.method == "POST":
         email = request.POST.get("email")
         password = request.POST.get("password")
 
-        try:
-            user_obj = User.objects.get(email=email)
-        except User.DoesNotExist:
+        # case-insensitive, served by the UPPER(email) index (migration 0006)
+        user_obj = User.objects.filter(email__iexact=email).first()
+        if user_obj is None:
             messages.error(request, "Invalid email")
             return redirect("login")
 
@@ -42,7 +64,7 @@ def signup_view(request):
         password = request.POST.get('password')
 
         #check if the email is already in use
-        if User.objects.filter(email=email).exists():
+        if User.objects.filter(email__iexact=email).exists():
             messages.info(request, "Email already has an account")
             return redirect("signup")
         
@@ -69,15 +91,71 @@ def logout_view(request):
     logout(request)
     return redirect("home")
 
+def _event_data_from_post(request):
+    # the event detail fields shared by the create and import forms
+    match_mode = request.POST.get("match_mode", Event.MODE_ANY)
+    if match_mode not in dict(Event.MATCH_MODE_CHOICES):
+        match_mode = Event.MODE_ANY
+    history_mode = request.POST.get("history_mode", Event.HISTORY_OFF)
+    if history_mode not in dict(Event.HISTORY_MODE_CHOICES):
+        history_mode = Event.HISTORY_OFF
+
+    return {
+        "event_name": (request.POST.get("event_name", "") or "").strip(),
+        "event_date": (request.POST.get("event_date", "") or "").strip(),
+        "event_time": (request.POST.get("event_time", "") or "").strip(),
+        "event_location": (request.POST.get("event_location", "") or "").strip(),
+        "event_budget": (request.POST.get("event_budget", "") or "").strip(),
+        "match_mode": match_mode,
+        "history_mode": history_mode,
+    }
+
+def _event_data_errors(event_data):
+    # what Event.objects.create would reject, for the import form (one pass, no dry run yet)
+    errors = []
+    if not event_data["event_name"]:
+        errors.append("Please give the event a name.")
+    for key, field, label in [
+        ("event_name", "event_name", "Event name"),
+        ("event_location", "location", "Location"),
+        ("event_budget", "budget", "Budget"),
+    ]:
+        max_length = Event._meta.get_field(field).max_length
+        if len(event_data[key]) > max_length:
+            errors.append(f"{label} can be at most {max_length} characters.")
+    try:
+        event_date = parse_date(event_data["event_date"])
+    except ValueError:
+        event_date = None
+    if event_date is None:
+        errors.append("Please give a valid event date.")
+    if event_data["event_time"]:
+        try:
+            event_time = parse_time(event_data["event_time"])
+        except ValueError:
+            event_time = None
+        if event_time is None:
+            errors.append("Please give a valid event time.")
+    return errors
+
+def _current_draft(request, for_update=False):
+    # the wizard's draft, only ever the logged-in user's own
+    draft_id = request.session.get("draft_id")
+    if draft_id is None:
+        return None
+    drafts = EventDraft.objects.select_for_update() if for_update else EventDraft.objects
+    return drafts.filter(id=draft_id, owner=request.user).first()
+
 @login_required
 def create_event(request):
     organizer_name = request.user.first_name
     organizer_email = request.user.email
+    max_participants = settings.SANTA_MAX_PARTICIPANTS
     if request.method == "POST":
-        # collect participants 1-30
+        # collect participants 1-max_participants
         participants = []
 
-        for i in range(1, 31):
+        for i in range(1, max_participants + 1):
             name = (request.POST.get(f"p{i}", "") or "").strip()
             email = (request.POST.get(f"p{i}_email", "") or "").strip()
 
@@ -90,18 +168,22 @@ def create_event(request):
                 return render(request, "santa/create_event.html", {
                     "organizer_name": organizer_name,
                     "organizer_email": organizer_email,
-                    "extra_range": range(5, 31),
+                    "max_participants": max_participants,
+                    "match_mode_choices": Event.MATCH_MODE_CHOICES,
+                    "history_mode_choices": Event.HISTORY_MODE_CHOICES,
                     "error": f"Participant {i}: please enter BOTH a name and an email."
                 })
 
             participants.append((name, email))
         #the return if the error is the participant amount
-        if not (4 <= len(participants) <= 30):
+        if not (4 <= len(participants) <= max_participants):
                 return render(request, "santa/create_event.html", {
                     "organizer_name": organizer_name,
                     "organizer_email": organizer_email,
-                    "extra_range": range(5, 31),
-                    "error": "Add between 4 and 30 participants."
+                    "max_participants": max_participants,
+                    "match_mode_choices": Event.MATCH_MODE_CHOICES,
+                    "history_mode_choices": Event.HISTORY_MODE_CHOICES,
+                    "error": f"Add between 4 and {max_participants} participants."
                 })
         #prevent duplicates
          #the return if the error is the duplicates
@@ -110,95 +192,267 @@ def create_event(request):
             return render(request, "santa/create_event.html", {
                 "organizer_name": organizer_name,
                 "organizer_email": organizer_email,
-                "extra_range": range(5, 31),
+                "max_participants": max_participants,
+                "match_mode_choices": Event.MATCH_MODE_CHOICES,
+                "history_mode_choices": Event.HISTORY_MODE_CHOICES,
                 "error": "Names must be unique."
                 })
         
 
 
-        event_name = (request.POST.get("event_name", "") or "").strip()
-        event_date = (request.POST.get("event_date", "") or "").strip()
-        event_time = (request.POST.get("event_time", "") or "").strip()
-        event_location = (request.POST.get("event_location", "") or "").strip()
-        event_budget = (request.POST.get("event_budget", "") or "").strip()
-
-
-
-        # store in session until restrictions are added 
-        request.session["event_data"] = {
-            "event_name": event_name,
-            "event_date": event_date,
-            "event_time": event_time,
-            "event_location": event_location,
-            "event_budget": event_budget,
-            }
-        request.session["participants"] = [{"name": n, "email": e} for n, e in participants]
+        # store in a draft until restrictions are added, the session only keeps its id
+        draft = _current_draft(request) or EventDraft(owner=request.user)
+        draft.event_data = _event_data_from_post(request)
+        draft.participants = [{"name": n, "email": e} for n, e in participants]
+        draft.matcher_state = None
+        draft.save()
+        if request.session.get("draft_id") != draft.id:
+            request.session["draft_id"] = draft.id
 
 
         return redirect("event_restrictions") 
 
-    saved_event = request.session.get("event_data", {})
-    saved_participants = request.session.get("participants", [])
+    draft = _current_draft(request)
+    saved_event = draft.event_data if draft else {}
+    saved_participants = draft.participants if draft else []
 
     return render(request, "santa/create_event.html", {
         "organizer_name": organizer_name,
         "organizer_email": organizer_email,
-        "extra_range": range(5, 31),
+        "max_participants": max_participants,
+        "match_mode_choices": Event.MATCH_MODE_CHOICES,
+        "history_mode_choices": Event.HISTORY_MODE_CHOICES,
         "saved_event": saved_event,
         "saved_participants": saved_participants,
     })
 
 @login_required
-def event_view(request, event_id):
-    event = get_object_or_404(Event, id=event_id)
-
-    is_organizer = (event.organizer == request.user)
-
-    participant = Participant.objects.filter(event=event, email=request.user.email).first()
-
-    my_match = None
-    if participant:
-        my_match = Match.objects.filter(event=event, giver=participant).select_related("receiver").first()
-
-    all_matches = None
+async def event_view(request, event_id):
+    # Rendered pieces come from santa.page_cache when nothing changed since
+    # they were made; only the email statuses and the generate form are live.
+    # Async (served by uvicorn, see Procfile): everything below is awaited or
+    # already loaded, nothing may hit the database synchronously.
+    request.user = user = await request.auser()  # for the templates
+    version = await page_cache.aversion(event_id)
+    fragments = await page_cache.aget(event_id, version, ["meta", "details", "matches"])
+    meta = fragments.get("meta")
+    if meta is None:
+        # event + organizer in one query, participants in a second one
+        event = await aget_object_or_404(Event.objects.select_related("organizer"), id=event_id)
+        participants = [p async for p in Participant.objects.filter(event_id=event_id).order_by("id")]
+        meta = {
+            "organizer_id": event.organizer_id,
+            "event_name": event.event_name,
+            "emails": {p.email: p.id for p in participants},
+        }
+        fragments["details"] = render_to_string("santa/event_details.html", {
+            "event": event,
+            "participants": participants,
+        })
+        await page_cache.astore(event_id, version, {"meta": meta, "details": fragments["details"]})
+
+    is_organizer = (meta["organizer_id"] == user.id)
+    participant_id = meta["emails"].get(user.email)
+
+    box_name = f"box:{participant_id or 'guest'}"
+    box = (await page_cache.aget(event_id, version, [box_name])).get(box_name)
+    if box is None:
+        my_match = None
+        if participant_id:
+            my_match = await Match.objects.filter(event_id=event_id, giver_id=participant_id).select_related("receiver").afirst()
+        box = render_to_string("santa/event_match.html", {"participant": participant_id, "my_match": my_match})
+        await page_cache.astore(event_id, version, {box_name: box})
+
+    matches = None
+    outbound_emails = None
     if is_organizer:
-        all_matches = Match.objects.filter(event=event).select_related("giver", "receiver").order_by("giver__name")
+        matches = fragments.get("matches")
+        if matches is None:
+            # big events only show the first page here, the rest is in the export
+            limit = settings.SANTA_MATCHES_ON_PAGE
+            all_matches = [
+                m async for m in
+                Match.objects.filter(event_id=event_id).select_related("giver", "receiver").order_by("giver__name")[:limit + 1]
+            ]
+            matches = {
+                "generated": bool(all_matches),
+                "html": render_to_string("santa/event_matches.html", {
+                    "event_id": event_id,
+                    "all_matches": all_matches[:limit],
+                    "more_matches": len(all_matches) > limit,
+                }),
+            }
+            await page_cache.astore(event_id, version, {"matches": matches})
+        outbound_emails = [
+            email async for email in
+            OutboundEmail.objects.filter(event_id=event_id).exclude(status=OutboundEmail.STATUS_SUPERSEDED).select_related("participant").order_by("participant__name")
+        ]
 
     return render(request, "santa/event.html", {
-        "event": event,
+        "event_id": event_id,
+        "event_name": meta["event_name"],
+        "details": mark_safe(fragments["details"]),
+        "match_box": mark_safe(box),
         "is_organizer": is_organizer,
-        "participant": participant,
-        "my_match": my_match,
-        "all_matches": all_matches,
+        "matches_generated": matches and matches["generated"],
+        "matches": mark_safe(matches["html"]) if matches else "",
+        "outbound_emails": outbound_emails,
+        # idempotency token for the generate form (see claim_generation)
+        "generation_token": uuid.uuid4().hex if is_organizer else "",
     })
 
 
+def _parse_cursor(value):
+    # "<event_date>_<id>" of the last event on the previous page
+    try:
+        day, event_id = value.split("_")
+        return datetime.date.fromisoformat(day), int(event_id)
+    except ValueError:
+        return None
+
+
+def _events_page(user, after=None, size=20):
+    """
+    ((event_date, id) keys, has_more) of one page of the user's events, newest
+    first. Keyset pagination: the page starts right after `after` instead of
+    at an OFFSET, so it costs the same however far back it is. The organized
+    and invited events are two index lookups (event_organizer_date_idx,
+    participant_email_idx) merged by UNION, instead of an OR across the join
+    that needs DISTINCT.
+    """
+    organized = Event.objects.filter(organizer=user)
+    invited = Event.objects.filter(participants__email=user.email)
+    if after is not None:
+        older = Q(event_date__lt=after[0]) | Q(event_date=after[0], id__lt=after[1])
+        organized = organized.filter(older)
+        invited = invited.filter(older)
+
+    organized = organized.values_list("event_date", "id")
+    invited = invited.values_list("event_date", "id")
+    if connection.features.supports_slicing_ordering_in_compound:
+        # each side stops after one page too (not on SQLite)
+        organized = organized.order_by("-event_date", "-id")[:size + 1]
+        invited = invited.order_by("-event_date", "-id")[:size + 1]
+
+    keys = list(organized.union(invited).order_by("-event_date", "-id")[:size + 1])
+    return keys[:size], len(keys) > size
+
+
 @login_required
 def events(request):
-    user = request.user
+    after = _parse_cursor(request.GET.get("after", ""))
+    keys, has_more = _events_page(request.user, after, settings.SANTA_EVENTS_PER_PAGE)
 
-    events = Event.objects.filter(
-        Q(organizer=user) |
-        Q(participants__email=user.email)
-    ).distinct()
+    events = []
+    if keys:
+        events = Event.objects.filter(id__in=[event_id for _, event_id in keys]).select_related(
+            "organizer"
+        ).order_by("-event_date", "-id")
 
     return render(request, "santa/events_list.html", {
-        "events": events
+        "events": events,
+        "first_page": after is None,
+        "next_cursor": f"{keys[-1][0].isoformat()}_{keys[-1][1]}" if has_more else None,
     })
 
 
+def _restriction_rows(participants, restrictions_map=None, conflict=()):
+    # participants for restrictions.html, with the boxes already ticked and
+    # whether the person is part of an impossible group
+    restrictions_map = restrictions_map or {}
+    return [
+        dict(p, excluded=restrictions_map.get(i, set()) - {i}, conflict=i in conflict)
+        for i, p in enumerate(participants)
+    ]
+
+def _render_restrictions(request, draft, context, restrictions_map=None):
+    # (re)seed the live feasibility checker with what the page will show ticked
+    draft.matcher_state = IncrementalMatcher(len(draft.participants), restrictions_map).to_state()
+    draft.save(update_fields=["matcher_state", "updated_at"])
+    return render(request, "santa/restrictions.html", context)
+
+def _join_names(names):
+    names = list(names)
+    if len(names) <= 1:
+        return "".join(names)
+    return ", ".join(names[:-1]) + " and " + names[-1]
+
+def _infeasible_error(participants, restrictions_map, single_cycle, fix):
+    # say exactly which people are over-restricted (Hall's theorem); returns (message, their indexes)
+    violation = find_hall_violation(len(participants), restrictions_map)
+    if violation is not None:
+        givers = _join_names(participants[i]["name"] for i in violation.givers)
+        receivers = _join_names(participants[i]["name"] for i in violation.receivers) or "nobody"
+        error = (
+            f"Too many restrictions — {givers} can only draw {receivers} between them "
+            f"({len(violation.givers)} people, {len(violation.receivers)} names). "
+            f"{fix} and try again."
+        )
+        return error, set(violation.givers)
+    if single_cycle:
+        return "Too many restrictions — can't fit everyone into one circle. Remove a few exclusions and try again.", set()
+    return "Too many restrictions — can't generate valid matches. Remove a few exclusions and try again.", set()
+
+# the circle search gave up: not proved impossible, another try may find one
+GAVE_UP_ERROR = "Couldn't find one circle through everyone this time. Try again, or remove a few exclusions."
+
 @login_required
-def restrictions_view(request):
-    event_data = request.session.get("event_data")
-    participants = request.session.get("participants")  # list of dicts: {"name","email"}
+def import_event_view(request):
+    """Create an event from an uploaded roster (CSV / JSON Lines) instead of the wizard."""
+    context = {
+        "max_participants": settings.SANTA_MAX_IMPORT_PARTICIPANTS,
+        "match_mode_choices": Event.MATCH_MODE_CHOICES,
+        "history_mode_choices": Event.HISTORY_MODE_CHOICES,
+    }
+    if request.method != "POST":
+        return render(request, "santa/import_event.html", context)
+
+    event_data = _event_data_from_post(request)
+    context["saved_event"] = event_data
+    errors = _event_data_errors(event_data)
+    upload = request.FILES.get("roster")
+    if upload is None:
+        context["errors"] = errors + ["Choose a CSV or JSON Lines file to import."]
+        return render(request, "santa/import_event.html", context)
+
+    roster = parse_roster(upload, settings.SANTA_MAX_IMPORT_PARTICIPANTS)
+    if errors or roster.errors:
+        context["errors"] = errors + roster.errors
+        return render(request, "santa/import_event.html", context)
+
+    single_cycle = event_data["match_mode"] == Event.MODE_CYCLE
+    n = len(roster.participants)
+    try:
+        test_assignment = dry_run_matches_from_restrictions(n, roster.restrictions_map, single_cycle=single_cycle)
+    except SolverGaveUp:
+        context["errors"] = [GAVE_UP_ERROR]
+        return render(request, "santa/import_event.html", context)
+    if test_assignment is None:
+        error, _ = _infeasible_error(
+            roster.participants, roster.restrictions_map, single_cycle, "Remove some of their excludes"
+        )
+        context["errors"] = [error]
+        return render(request, "santa/import_event.html", context)
+
+    event = create_event_with_participants(
+        request.user, event_data, roster.participants, roster.restrictions_map,
+        batch_size=settings.SANTA_IMPORT_BATCH_SIZE,
+    )
+    messages.success(request, f"Imported {n} participants.")
+    return redirect("event_details", event_id=event.id)
 
-    if not event_data or not participants:
+@login_required
+def restrictions_view(request):
+    draft = _current_draft(request)
+    if draft is None or not draft.event_data or not draft.participants:
         return redirect("create_event")
+    event_data = draft.event_data
+    participants = draft.participants  # list of dicts: {"name","email"}
 
     if request.method == "GET":
-        return render(request, "santa/restrictions.html", {
+        return _render_restrictions(request, draft, {
             "event_data": event_data,
-            "participants": participants,
+            "participants": _restriction_rows(participants),
             "max_exclusions": max(0, len(participants) - 3),
         })
 
@@ -213,12 +467,12 @@ def restrictions_view(request):
         selected = request.POST.getlist(f"exclude_{giver_index}")
 
         if len(selected) > max_allowed:
-            return render(request, "santa/restrictions.html", {
+            return _render_restrictions(request, draft, {
                 "event_data": event_data,
-                "participants": participants,
+                "participants": _restriction_rows(participants, restrictions_map),
                 "max_exclusions": max_allowed,
                 "error": f"You can exclude at most {max_allowed} names per person."
-            })
+            }, restrictions_map)
 
         forbidden = {giver_index}  # always forbid self
         for idx_str in selected:
@@ -232,108 +486,196 @@ def restrictions_view(request):
         restrictions_map[giver_index] = forbidden
 
     # 2) DRY RUN: test if matching is possible BEFORE saving event
-    test_assignment = dry_run_matches_from_restrictions(n, restrictions_map)
+    single_cycle = event_data.get("match_mode") == Event.MODE_CYCLE
+    try:
+        test_assignment = dry_run_matches_from_restrictions(n, restrictions_map, single_cycle=single_cycle)
+    except SolverGaveUp:
+        return _render_restrictions(request, draft, {
+            "event_data": event_data,
+            "participants": _restriction_rows(participants, restrictions_map),
+            "max_exclusions": max_allowed,
+            "error": GAVE_UP_ERROR,
+        }, restrictions_map)
     if test_assignment is None:
-        return render(request, "santa/restrictions.html", {
+        error, conflict = _infeasible_error(
+            participants, restrictions_map, single_cycle, "Untick some of their exclusions (highlighted below)"
+        )
+        return _render_restrictions(request, draft, {
             "event_data": event_data,
-            "participants": participants,
+            "participants": _restriction_rows(participants, restrictions_map, conflict),
             "max_exclusions": max_allowed,
-            "error": "Too many restrictions — can't generate valid matches. Remove a few exclusions and try again."
-        })
+            "error": error
+        }, restrictions_map)
 
     # 3) Now it's safe: create event + participants + exclusions
-    event = Event.objects.create(
-        organizer=request.user,
-        event_name=event_data["event_name"],
-        event_date=event_data["event_date"],
-        time=event_data.get("event_time") or None,
-        location=event_data.get("event_location", ""),
-        budget=event_data.get("event_budget", ""),
-    )
+    event = create_event_with_participants(request.user, event_data, participants, restrictions_map)
 
-    participant_objs = [
-        Participant(event=event, name=p["name"], email=p["email"])
-        for p in participants
-    ]
-    Participant.objects.bulk_create(participant_objs)
+    # 4) Done with the draft
+    draft.delete()
+    request.session.pop("draft_id", None)
 
-    participants_db = list(event.participants.all().order_by("id"))
+    return redirect("event_details", event_id=event.id)
 
-    for giver_index, giver in enumerate(participants_db):
-        selected = request.POST.getlist(f"exclude_{giver_index}")
-        for idx_str in selected:
-            try:
-                idx = int(idx_str)
-            except ValueError:
-                continue
-            if 0 <= idx < n and idx != giver_index:
-                Exclusion.objects.create(
-                    event=event,
-                    giver=giver,
-                    excluded=participants_db[idx]
-                )
 
-    # 4) Clear session
-    request.session.pop("event_data", None)
-    request.session.pop("participants", None)
+@login_required
+@require_POST
+def restrictions_check_view(request):
+    """
+    Live feasibility for the restrictions form: one checkbox change per call,
+    the matching is kept in the draft and repaired incrementally.
+    POST giver, receiver (indexes), excluded ("1" ticked / "0" unticked)
+    """
+    # locked until the new state is saved: two quick clicks must not both
+    # start from the same state
+    with transaction.atomic():
+        draft = _current_draft(request, for_update=True)
+        participants = draft.participants if draft else None
+        state = draft.matcher_state if draft else None
+        if not participants or not state or state["n"] != len(participants):
+            return JsonResponse({"error": "No event in progress."}, status=400)
 
-    return redirect("event_details", event_id=event.id)
+        n = len(participants)
+        try:
+            giver = int(request.POST.get("giver", ""))
+            receiver = int(request.POST.get("receiver", ""))
+        except ValueError:
+            return JsonResponse({"error": "giver and receiver must be numbers."}, status=400)
+        if not (0 <= giver < n and 0 <= receiver < n):
+            return JsonResponse({"error": "Unknown participant."}, status=400)
+
+        matcher = IncrementalMatcher.from_state(state)
+        if request.POST.get("excluded") == "1":
+            feasible = matcher.exclude(giver, receiver)
+        else:
+            feasible = matcher.allow(giver, receiver)
+        # one column UPDATE, the session isn't touched
+        EventDraft.objects.filter(id=draft.id).update(matcher_state=matcher.to_state(), updated_at=timezone.now())
+
+        # only pairings are checked live; one circle is checked on submit
+        response = {"feasible": feasible, "single_cycle": draft.event_data.get("match_mode") == Event.MODE_CYCLE}
+        if not feasible:
+            violation = matcher.violation()
+            if violation is not None:
+                response["givers"] = violation.givers
+                response["message"] = (
+                    f"{_join_names(participants[i]['name'] for i in violation.givers)} can only draw "
+                    f"{_join_names(participants[i]['name'] for i in violation.receivers) or 'nobody'} between them."
+                )
+        return JsonResponse(response)
 
 
 @login_required
-def generate_matches_view(request, event_id):
-    event = get_object_or_404(Event, id=event_id)
+async def generate_matches_view(request, event_id):
+    # Async so a slow solve doesn't hold a worker: the locking and saving
+    # (transactions) and the solve run in a thread via sync_to_async.
+    user = await request.auser()
+    event = await aget_object_or_404(Event, id=event_id)
 
     # organizer-only
-    if event.organizer != request.user:
+    if event.organizer_id != user.id:
         messages.error(request, "Only the organizer can generate matches.")
         return redirect("event_details", event_id=event.id)
 
     if request.method != "POST":
         return redirect("event_details", event_id=event.id)
 
-    with transaction.atomic():
-        # If re-generating, clear old matches first
-        Match.objects.filter(event=event).delete()
+    # double clicks / retries post the same token: answer them without solving again
+    duplicate = await sync_to_async(claim_generation)(event.id, request.POST.get("generation_token", ""))
+    if duplicate == Event.GENERATION_RUNNING:
+        messages.info(request, "Matches are being generated right now, give it a moment.")
+        return redirect("event_details", event_id=event.id)
+    if duplicate == Event.GENERATION_DONE:
+        messages.info(request, "Matches were already generated.")
+        return redirect("event_details", event_id=event.id)
+    if duplicate == Event.GENERATION_FAILED:
+        messages.error(request, "Too many restrictions — can't generate valid matches.")
+        return redirect("event_details", event_id=event.id)
 
-        matches = generate_secret_santa_matches(event)
-        if matches is None:
-            messages.error(request, "Too many restrictions — can't generate valid matches.")
-            return redirect("event_details", event_id=event.id)
-
-        # Save matches
-        objs = []
-        for giver, receiver in matches.items():
-            objs.append(Match(event=event, giver=giver, receiver=receiver))
-        Match.objects.bulk_create(objs)
-
-        matches_qs = Match.objects.filter(event=event).select_related("giver", "receiver")
-        sent = 0
-        for m in matches_qs:
-            send_match_email(event, m.giver, m.receiver)
-            sent += 1
-
-    messages.success(request, f"Matches generated and emailed to {sent} participants!")
+    # solved outside the row lock, saved under it
+    try:
+        matches = await sync_to_async(generate_secret_santa_matches)(event)
+        queued = await sync_to_async(save_generated_matches)(event, matches)
+    except SolverGaveUp:
+        await Event.objects.filter(id=event.id).aupdate(generation_status=Event.GENERATION_IDLE, generation_token="")
+        messages.error(request, GAVE_UP_ERROR)
+        return redirect("event_details", event_id=event.id)
+    except Exception:
+        # let a retry start over instead of waiting for the timeout
+        await Event.objects.filter(id=event.id).aupdate(generation_status=Event.GENERATION_IDLE, generation_token="")
+        raise
+    if matches is None:
+        messages.error(request, "Too many restrictions — can't generate valid matches.")
+        return redirect("event_details", event_id=event.id)
+
+    messages.success(request, f"Matches generated! Emails to {queued} participants are on their way.")
     return redirect("event_details", event_id=event.id)
 
-def send_match_email(event, giver, receiver):
-    login_link = f"{settings.SITE_URL}/login/"
-    subject = f"Your Secret Santa match for {event.event_name}"
-    body = (
-        f"Hi {giver.name},\n\n"
-        f"You are getting a gift for: {receiver.name}.\n\n"
-        f"Event details:\n"
-        f"- Date: {event.event_date}\n"
-        f"- Time: {event.time or '-'}\n"
-        f"- Location: {event.location or '-'}\n"
-        f"- Budget: {event.budget or '-'}\n\n"
-        f"You can also log in using this email ({giver.email}) to view your match at {login_link}.\n"
+class _Echo:
+    # csv.writer target that hands each formatted row straight back
+    def write(self, value):
+        return value
+
+@login_required
+async def export_matches_view(request, event_id):
+    """
+    All matches of an event as CSV (default) or JSON (?format=json), streamed
+    in chunks straight from the database so memory doesn't grow with the event.
+    Async so that the ASGI server streams it: it would have to buffer a
+    synchronous iterator whole.
+    """
+    user = await request.auser()
+    event = await aget_object_or_404(Event, id=event_id)
+    if event.organizer_id != user.id:
+        messages.error(request, "Only the organizer can export matches.")
+        return redirect("event_details", event_id=event.id)
+
+    columns = ["giver_name", "giver_email", "receiver_name", "receiver_email"]
+    # values(), not values_list(): values_list().aiterator() runs its query
+    # synchronously on the first step
+    rows = (
+        Match.objects.filter(event=event)
+        .order_by("giver__name")
+        .values(
+            giver_name=F("giver__name"), giver_email=F("giver__email"),
+            receiver_name=F("receiver__name"), receiver_email=F("receiver__email"),
+        )
+        .aiterator(chunk_size=settings.SANTA_EXPORT_CHUNK_SIZE)
     )
 
-    send_mail(
-        subject=subject,
-        message=body,
-        from_email=getattr(settings, "DEFAULT_FROM_EMAIL", None),
-        recipient_list=[giver.email],
-        fail_silently=False,
-    )
\ No newline at end of file
+    if request.GET.get("format") == "json":
+        async def chunks():
+            separator = ""
+            yield "["
+            async for row in rows:
+                yield separator + json.dumps(row)
+                separator = ","
+            yield "]\n"
+        content_type, extension = "application/json", "json"
+    else:
+        async def chunks():
+            writer = csv.writer(_Echo())
+            yield writer.writerow(columns)
+            async for row in rows:
+                yield writer.writerow([row[column] for column in columns])
+        content_type, extension = "text/csv", "csv"
+
+    response = StreamingHttpResponse(chunks(), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="matches-{event.id}.{extension}"'
+    return response
+
+@staff_member_required
+def solver_cache_stats_view(request):
+    # hit/miss counters for monitoring; per worker unless the cache is shared
+    shared = settings.CACHES["default"]["BACKEND"] not in settings.PROCESS_LOCAL_CACHES
+    return JsonResponse({**solver_cache.stats(), "shared": shared})
+
+
+def metrics_view(request):
+    # Prometheus scrape target, see santa/metrics.py
+    if not settings.SANTA_METRICS_ENABLED:
+        raise Http404
+    token = settings.SANTA_METRICS_TOKEN
+    bearer = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not (request.user.is_staff or (token and hmac.compare_digest(bearer, token))):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")